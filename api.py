@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import data_processing as dp
+import datasets
+import jobs
+import reports
+import result_cache
+import storage
+
+# Local HTTP service running the grouping pipeline for other tools, without the UI:
+#
+#   POST   /jobs                   CSV body, or JSON {"path": "..."} inside --data-dir
+#   GET    /jobs/<id>              status and progress
+#   GET    /jobs/<id>/<sheet>      grouped, metrics or scores; ?format=json|arrow|parquet|csv
+#   DELETE /jobs/<id>              cancel
+#   GET    /health                 pending jobs, queue capacity and memory held by results
+#
+# A full queue answers 429 with Retry-After instead of accepting more work. Finished jobs are
+# kept for fetching within a memory budget; jobs dropped from it answer 404.
+
+API_HOST = os.environ.get('API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('API_PORT', '8600'))
+# Jobs grouped at the same time, and jobs accepted (queued or running) before pushing back
+API_WORKERS = int(os.environ.get('API_WORKERS', '2'))
+API_MAX_PENDING = int(os.environ.get('API_MAX_PENDING', '8'))
+# Results of finished jobs held for clients to fetch; the least recently read go first
+API_RESULT_BYTES = int(os.environ.get('API_RESULT_BYTES', jobs.JOB_RESULT_MAX_BYTES))
+# Same limit as Streamlit's default upload size
+MAX_UPLOAD_BYTES = int(os.environ.get('API_MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+RETRY_AFTER_SECONDS = 5
+# Uploads are copied to disk once they grow past this
+SPOOL_MAX_BYTES = dp.SPOOL_MAX_BYTES
+# Rows parsed per chunk, so large files report reading progress
+CSV_CHUNK_ROWS = 100000
+SCHEMA_NAME = 'ahrefs'
+
+# Columns of the scores sheet, where the export has them
+SCORE_COLUMNS = ['Keyword', 'Parent Keyword', 'Volume', 'Difficulty', 'CPC', 'Traffic potential', 'Opportunity Score']
+
+# Result sheets: name -> (partial result it is built from, table builder)
+RESULT_SHEETS = {
+    'grouped': ('grouped', lambda grouped: grouped.reset_index(drop=True)),
+    'metrics': ('metrics', lambda metrics: metrics.rename_axis('Group').reset_index()),
+    'scores': ('data', lambda data: data[[column for column in SCORE_COLUMNS if column in data.columns]].reset_index(drop=True)),
+}
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.file',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# A request the client has to fix, answered with its status code and message
+class RequestError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(message)
+
+# Parse, score, group and aggregate one export on a pool thread. Scores and grouped keywords
+# can be fetched while the metrics are still being aggregated. `source` is a path or a spooled
+# upload, closed once parsed.
+def grouping_job(job, source, digest):
+    try:
+        dataset = datasets.parse_dataset(source, digest, CSV_CHUNK_ROWS, lambda fraction: job.report('reading', fraction, 1.0), SCHEMA_NAME)
+    finally:
+        if hasattr(source, 'close'):
+            source.close()
+    if dataset is None:
+        raise ValueError("could not parse the file; check the encoding and the file format")
+    return dp.run_pipeline(dataset['data'], reports.DEFAULT_STOP_WORDS, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE, progress=job.report, publish=job.publish)
+
+def job_status(job):
+    status = {
+        'id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'done': job.done,
+        'total': job.total,
+        'error': str(job.error) if job.error else None,
+    }
+    results = job.result if job.status == jobs.DONE else job.partial
+    status['sheets'] = [sheet for sheet, (source, _) in RESULT_SHEETS.items() if results and source in results]
+    if job.status == jobs.DONE:
+        status['rows'] = len(job.result['data'])
+        status['groups'] = len(job.result['metrics'])
+    return status
+
+# Encode a table in the requested format; columnar formats go through a temporary file
+def encode_table(df, fmt):
+    if fmt == 'json':
+        return df.to_json(orient='records').encode()
+    if fmt != 'csv' and not storage.HAS_ARROW:
+        raise RequestError(400, f"{fmt} results need pyarrow, which is not installed")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'result' + storage.extension(fmt))
+        storage.write_table(df, path, index=False)
+        with open(path, 'rb') as result_file:
+            return result_file.read()
+
+class ApiHandler(BaseHTTPRequestHandler):
+    server_version = 'KeywordGrouper/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.dispatch(self.get)
+
+    def do_POST(self):
+        self.dispatch(self.post)
+
+    def do_DELETE(self):
+        self.dispatch(self.delete)
+
+    # Route a request; errors the client can fix become JSON error bodies
+    def dispatch(self, handler):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            handler(parts, parse_qs(url.query))
+        except RequestError as error:
+            # The request body may be unread, so the connection cannot carry another request
+            self.close_connection = True
+            self.send_json(error.status, {'error': str(error)})
+
+    def get(self, parts, query):
+        if parts == ['health']:
+            pool = self.server.pool
+            self.send_json(200, {
+                'pending': pool.pending(),
+                'max_pending': pool.max_pending,
+                'result_bytes': pool.finished.total_bytes,
+                'max_result_bytes': pool.finished.max_bytes,
+            })
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            self.send_json(200, job_status(self.find_job(parts[1])))
+        elif len(parts) == 3 and parts[0] == 'jobs':
+            self.send_sheet(self.find_job(parts[1]), parts[2], query.get('format', ['json'])[0])
+        else:
+            raise RequestError(404, "not found")
+
+    def post(self, parts, query):
+        if parts != ['jobs']:
+            raise RequestError(404, "not found")
+        source, digest = self.read_source()
+        key = result_cache.make_key(digest, reports.DEFAULT_STOP_WORDS, reports.NGRAM_SIZE, reports.MIN_GROUP_SIZE)
+        # Submitting the same file again joins the job already grouping it; the unused upload
+        # is deleted once this request lets go of it
+        try:
+            job = self.server.pool.submit(key, grouping_job, source, digest)
+        except jobs.QueueFull:
+            self.send_json(429, {'error': "too many jobs pending, retry later"}, {'Retry-After': str(RETRY_AFTER_SECONDS)})
+            return
+        self.send_json(202, job_status(job), {'Location': f"/jobs/{job.id}"})
+
+    def delete(self, parts, query):
+        if len(parts) != 2 or parts[0] != 'jobs':
+            raise RequestError(404, "not found")
+        # Cancels the job for every client, including any that submitted the same file
+        job = self.find_job(parts[1])
+        job.cancel()
+        self.send_json(202, job_status(job))
+
+    def find_job(self, job_id):
+        job = self.server.pool.get(job_id)
+        if job is None:
+            raise RequestError(404, f"no job {job_id}")
+        return job
+
+    # The CSV to group: the request body, or a file under the data directory named in a JSON body
+    def read_source(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_UPLOAD_BYTES:
+            raise RequestError(413, f"uploads are limited to {MAX_UPLOAD_BYTES:,} bytes")
+        if self.headers.get_content_type() == 'application/json':
+            try:
+                path = json.loads(self.rfile.read(length) or b'{}').get('path')
+            except (ValueError, AttributeError):
+                raise RequestError(400, "the JSON body must be an object with a path")
+            return self.resolve_path(path)
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        remaining = length
+        while remaining:
+            block = self.rfile.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            spool.write(block)
+            remaining -= len(block)
+        if not spool.tell():
+            spool.close()
+            raise RequestError(400, "send a CSV body or a JSON body with a path")
+        return spool, dp.file_digest(spool)
+
+    # Resolve a submitted path; only files inside the configured data directory may be read
+    def resolve_path(self, path):
+        data_dir = self.server.data_dir
+        if not path:
+            raise RequestError(400, "the JSON body needs a path")
+        if data_dir is None:
+            raise RequestError(403, "reading files by path is disabled; start the server with --data-dir")
+        full_path = os.path.realpath(os.path.join(data_dir, path))
+        if os.path.commonpath([full_path, data_dir]) != data_dir:
+            raise RequestError(403, "the path is outside the data directory")
+        if not os.path.isfile(full_path):
+            raise RequestError(404, f"no file {path}")
+        return full_path, dp.file_digest(full_path)
+
+    # One result sheet; partial sheets are served while the job is still running
+    def send_sheet(self, job, sheet, fmt):
+        if sheet not in RESULT_SHEETS:
+            raise RequestError(404, f"unknown sheet {sheet}; use one of {', '.join(RESULT_SHEETS)}")
+        if fmt not in CONTENT_TYPES:
+            raise RequestError(400, f"unknown format {fmt}; use one of {', '.join(CONTENT_TYPES)}")
+        if job.status in (jobs.FAILED, jobs.CANCELLED):
+            raise RequestError(409, f"job {job.status}" + (f": {job.error}" if job.error else ""))
+        source, build = RESULT_SHEETS[sheet]
+        results = job.result if job.status == jobs.DONE else job.partial
+        if source not in results:
+            raise RequestError(409, f"{sheet} is not ready yet; the job is {job.status}")
+        body = encode_table(build(results[source]), fmt)
+        self.send_body(200, body, CONTENT_TYPES[fmt], {'X-Job-Status': job.status})
+
+    def send_json(self, status, payload, headers=None):
+        self.send_body(status, json.dumps(payload).encode(), CONTENT_TYPES['json'], headers)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+# A threaded server: request threads only parse uploads and answer, grouping runs on the pool
+def make_server(host=API_HOST, port=API_PORT, workers=API_WORKERS, max_pending=API_MAX_PENDING, data_dir=None, verbose=False, max_result_bytes=API_RESULT_BYTES):
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.pool = jobs.JobPool(workers, max_pending, max_result_bytes)
+    server.data_dir = os.path.realpath(data_dir) if data_dir else None
+    server.verbose = verbose
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve keyword grouping over HTTP on this machine.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--workers', type=int, default=API_WORKERS, help="Jobs grouped at the same time")
+    parser.add_argument('--max-pending', type=int, default=API_MAX_PENDING, help="Jobs queued or running before new ones get 429")
+    parser.add_argument('--max-result-bytes', type=int, default=API_RESULT_BYTES, help="Memory for results of finished jobs; the least recently read are dropped beyond it")
+    parser.add_argument('--data-dir', help="Directory whose CSV files may be submitted by path")
+    parser.add_argument('--verbose', action='store_true', help="Log every request")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.workers, args.max_pending, args.data_dir, args.verbose, args.max_result_bytes)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
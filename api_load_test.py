@@ -0,0 +1,144 @@
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import api
+import benchmark
+
+# Load test for the grouping API on localhost: concurrent clients submit generated exports,
+# back off on 429, poll their jobs and fetch the results. Starts its own server unless --url
+# points at a running one.
+#
+#   python api_load_test.py --clients 16 --jobs 4 --rows 20000
+#   python api_load_test.py --url http://127.0.0.1:8600 --clients 32
+
+# Seconds between status polls of one client
+POLL_SECONDS = 0.1
+# Longest a client waits for one job before counting it as failed
+JOB_TIMEOUT_SECONDS = 600
+
+def request(method, url, body=None, content_type=None):
+    headers = {'Content-Type': content_type} if content_type else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data=body, method=method, headers=headers)) as response:
+        return response.status, dict(response.headers), response.read()
+
+# Generated exports as CSV bytes, one per seed. With fewer files than jobs, clients cycle
+# through them and a file submitted while it is still grouping joins that job; the report
+# counts the distinct jobs the server ran.
+def make_payloads(count, rows):
+    payloads = []
+    for seed in range(count):
+        buffer = io.StringIO()
+        benchmark.generate_export(rows, seed).to_csv(buffer, index=False)
+        payloads.append(buffer.getvalue().encode())
+    return payloads
+
+# One job from submission to fetched metrics: retries on 429 after Retry-After (capped, so the
+# test keeps pressure on the queue), then polls until the job finishes
+def run_job(url, payload, stats, lock):
+    started = time.perf_counter()
+    while True:
+        try:
+            _, _, body = request('POST', f"{url}/jobs", payload, 'text/csv')
+            break
+        except urllib.error.HTTPError as error:
+            if error.code != 429:
+                raise
+            with lock:
+                stats['rejected'] += 1
+            time.sleep(min(float(error.headers.get('Retry-After', 1)), 0.5))
+    job_id = json.loads(body)['id']
+    while True:
+        status = json.loads(request('GET', f"{url}/jobs/{job_id}")[2])
+        if status['status'] in ('done', 'failed', 'cancelled'):
+            break
+        if time.perf_counter() - started > JOB_TIMEOUT_SECONDS:
+            raise TimeoutError(f"job {job_id} still {status['status']}")
+        time.sleep(POLL_SECONDS)
+    if status['status'] != 'done':
+        raise RuntimeError(f"job {job_id} {status['status']}: {status['error']}")
+    metrics = json.loads(request('GET', f"{url}/jobs/{job_id}/metrics")[2])
+    return time.perf_counter() - started, len(metrics), job_id
+
+# Sample /health while the clients run, for the deepest queue and the most result memory the
+# server reached
+def watch_pending(url, stats, stop):
+    while not stop.is_set():
+        health = json.loads(request('GET', f"{url}/health")[2])
+        stats['max_pending'] = max(stats['max_pending'], health['pending'])
+        stats['max_result_bytes'] = max(stats['max_result_bytes'], health['result_bytes'])
+        stop.wait(0.05)
+
+def run(url, clients, jobs_per_client, rows, files):
+    payloads = make_payloads(files, rows)
+    stats = {'rejected': 0, 'max_pending': 0, 'max_result_bytes': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_pending, args=(url, stats, stop), daemon=True)
+    watcher.start()
+
+    latencies, failures, job_ids = [], [], set()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        futures = [executor.submit(run_job, url, payloads[i % files], stats, lock) for i in range(clients * jobs_per_client)]
+        for future in futures:
+            try:
+                latency, _, job_id = future.result()
+                latencies.append(latency)
+                job_ids.add(job_id)
+            except Exception as error:
+                failures.append(str(error))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    watcher.join()
+
+    return {
+        'jobs': len(futures),
+        'completed': len(latencies),
+        'distinct_jobs': len(job_ids),
+        'failed': len(failures),
+        'failures': failures[:5],
+        'rejected_429': stats['rejected'],
+        'max_pending_seen': stats['max_pending'],
+        'max_result_bytes_seen': stats['max_result_bytes'],
+        'seconds': elapsed,
+        'jobs_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_p50': float(np.percentile(latencies, 50)) if latencies else None,
+        'latency_p95': float(np.percentile(latencies, 95)) if latencies else None,
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the keyword grouping API on localhost.")
+    parser.add_argument('--url', help="Running server to test; by default one is started on a free port")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--jobs', type=int, default=2, help="Jobs submitted by each client, one after another")
+    parser.add_argument('--rows', type=int, default=10000, help="Rows per generated export")
+    parser.add_argument('--files', type=int, default=4, help="Distinct exports cycled through by the clients")
+    parser.add_argument('--workers', type=int, default=api.API_WORKERS, help="Workers of the started server")
+    parser.add_argument('--max-pending', type=int, default=api.API_MAX_PENDING, help="Queue bound of the started server")
+    parser.add_argument('--max-result-bytes', type=int, default=api.API_RESULT_BYTES, help="Result memory budget of the started server")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = api.make_server('127.0.0.1', 0, args.workers, args.max_pending, max_result_bytes=args.max_result_bytes)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        report = run(url.rstrip('/'), args.clients, args.jobs, args.rows, args.files)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['failed'] else 0)
@@ -1,9 +1,35 @@
 import streamlit as st
 import pandas as pd
 import os
+import io
+import time
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import login  # Import the login module
 import data_processing as dp  # Import data processing functions
-import pickle  # For saving and loading computation state
+import result_cache  # Cache of grouping results across reruns
+import datasets  # Parsed uploads shared across sessions
+from keyword_index import KeywordIndex, filter_containing
+import table_view  # Paginated, per-page styled tables
+import pickle  # For loading computation states saved by older versions
+import storage  # Columnar storage for saved computations
+import session_memory  # Per-session memory accounting and spill-to-disk
+import instrumentation  # Per-stage timings, shown in the sidebar when enabled
+import reports  # Sheets built from the grouping results, shared with the batch runner
+import jobs  # Background job pool running the grouping outside the script run
+
+# Rows parsed per chunk while reading an upload, so large files report progress
+CSV_CHUNK_ROWS = 100000
+
+# Processes used to group large uploads; results are identical for any count
+GROUPING_WORKERS = int(os.environ.get('GROUPING_WORKERS', '1'))
+
+# How long a rerun waits before picking up a running grouping job's progress
+JOB_POLL_SECONDS = 0.5
+# Unit of the count each grouping stage reports; reading reports a fraction of the file
+JOB_STAGE_UNITS = {'counting words': 'keywords', 'tokenizing': 'keywords', 'aggregating groups': 'groups'}
+
+# Number formats of the top-20 cluster tables
+TOP_GROUP_FORMATS = {'Total Volume': '{:,.0f}', 'Avg. KD': '{:.2f}', 'Traffic Potential': '{:,.0f}'}
 
 # Check login state
 def check_login_state():
@@ -12,7 +38,7 @@ def check_login_state():
         st.experimental_set_query_params(page="login")
         st.stop()
 
-# Save computation state to a file in the user's directory
+# Save computation state to the user's directory, one columnar table per sheet
 def save_computation_state(data_frames, base_file_name="computation_state"):
     user_email = st.session_state.email
     user_directory = f"./user_data/{user_email}"
@@ -20,38 +46,164 @@ def save_computation_state(data_frames, base_file_name="computation_state"):
     if not os.path.exists(user_directory):
         os.makedirs(user_directory)
     
-    full_path = os.path.join(user_directory, f"{base_file_name}.pkl")
-    
-    with open(full_path, 'wb') as file:
-        pickle.dump(data_frames, file)
+    full_path = os.path.join(user_directory, f"{base_file_name}{storage.SHEETS_SUFFIX}")
+    storage.save_sheets(data_frames, full_path)
     
     st.success("Computation state saved successfully.")
 
-# Load computation state from a file
+# Load computation state from a sheets directory, or from a pickle saved by older versions
 def load_computation_state(file_name):
     user_email = st.session_state.email
     user_directory = f"./user_data/{user_email}"
     full_path = os.path.join(user_directory, file_name)
     
+    if file_name.endswith(storage.SHEETS_SUFFIX):
+        return storage.load_sheets(full_path)
     with open(full_path, 'rb') as file:
         return pickle.load(file)
 
-# List saved files for the user
-def list_saved_files(extension=".pkl"):
+# Sheets inside a saved state (name, rows, bytes, ...); None for pickles, which have no manifest
+def describe_saved_file(file_name):
+    user_email = st.session_state.email
+    full_path = os.path.join(f"./user_data/{user_email}", file_name)
+    if file_name.endswith(storage.SHEETS_SUFFIX):
+        return storage.read_manifest(full_path)['sheets']
+    return None
+
+# Open one sheet of a saved state when the user asks for it; only open sheets stay in session
+# state, and Arrow sheets are memory-mapped rather than read into the session
+def load_saved_sheet(file_name, sheet_name):
+    open_sheets = st.session_state.setdefault('open_sheets', {})
+    if (file_name, sheet_name) not in open_sheets:
+        user_email = st.session_state.email
+        full_path = os.path.join(f"./user_data/{user_email}", file_name)
+        open_sheets[(file_name, sheet_name)] = storage.load_sheet(full_path, sheet_name, mapped=True)
+    return open_sheets[(file_name, sheet_name)]
+
+# Release a sheet the user has closed
+def close_saved_sheet(file_name, sheet_name):
+    st.session_state.get('open_sheets', {}).pop((file_name, sheet_name), None)
+
+# List saved computation states for the user
+def list_saved_files(extensions=(storage.SHEETS_SUFFIX, ".pkl")):
     user_email = st.session_state.email
     user_directory = f"./user_data/{user_email}"
     
     if not os.path.exists(user_directory):
         os.makedirs(user_directory)
     
-    files = [f for f in os.listdir(user_directory) if f.endswith(extension)]
+    files = [f for f in os.listdir(user_directory) if f.endswith(extensions)]
     if files:
         return files
     else:
         return []
 
+# Read, score, group and aggregate an upload on a background job. The results go to the result
+# cache, where every later rerun of any session finds them, and carry the job's stage timings.
+def run_grouping_job(job, source, digest, cache_key, stop_words):
+    instrumentation.begin_run('grouping job')
+    # The parsed frame is shared with other sessions that uploaded the same file; raises
+    # SchemaError when required columns are missing
+    dataset = datasets.load_dataset(source, digest, chunksize=CSV_CHUNK_ROWS, progress=lambda fraction: job.report('reading', fraction, 1.0))
+    if dataset is None:
+        raise ValueError("Error parsing the file. Please check the encoding and the file format.")
+    results = dp.run_pipeline(dataset['data'], stop_words, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE, workers=GROUPING_WORKERS, progress=job.report, publish=job.publish)
+    results['footprint'] = dataset['footprint']
+    results['missing_columns'] = dataset['missing_columns']
+    # Gradient bounds do not depend on the sort order, so they are computed once per upload
+    results['gradient_bounds'] = table_view.gradient_bounds(results['data'])
+    results['timings'] = instrumentation.run_events()
+    # False when the results alone exceed the cache budget; sessions then keep their own reference
+    results['cached'] = result_cache.RESULTS.put(cache_key, results)
+    return results
+
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+# Content digest of the upload, hashed once per uploaded file rather than on every rerun
+def upload_digest(uploaded_file):
+    cached = st.session_state.get('upload_digest')
+    if cached is None or cached[0] != uploaded_file.file_id:
+        cached = (uploaded_file.file_id, dp.file_digest(uploaded_file))
+        st.session_state['upload_digest'] = cached
+    return cached[1]
+
+# This session's grouping job for the upload: started on the first rerun, or joined when another
+# session is already grouping the same file. A job still running for an earlier upload is
+# cancelled unless another session waits on it.
+def grouping_job(uploaded_file, digest, cache_key, stop_words):
+    job = jobs.JOBS.get(st.session_state.get('grouping_job'))
+    if job is None or job.key != cache_key:
+        release_grouping_job(cache_key)
+        job = None
+    if job is None or job.status == jobs.CANCELLED:
+        # The job reads its own copy, since reruns keep hashing and rewinding the upload
+        source = io.BytesIO(uploaded_file.getvalue())
+        job = jobs.JOBS.submit(cache_key, run_grouping_job, source, digest, cache_key, stop_words, owner=current_session_id())
+        st.session_state['grouping_job'] = job.id
+    return job
+
+# Forget the session's grouping job once its results are taken or the upload is gone, along
+# with results kept for an earlier upload
+def release_grouping_job(cache_key=None):
+    job = jobs.JOBS.get(st.session_state.pop('grouping_job', None))
+    if job is not None:
+        jobs.JOBS.release(job, current_session_id())
+    kept = st.session_state.get('grouping_results')
+    if kept is not None and kept[0] != cache_key:
+        del st.session_state['grouping_results']
+
+# Results of the upload: taken from the session's finished grouping job once, whose stage
+# timings then join this rerun's panel; else from the result cache; else kept by the session
+# because they were too large for the cache. None while they still have to be computed.
+def grouping_results(cache_key):
+    job = jobs.JOBS.get(st.session_state.get('grouping_job'))
+    if job is not None and job.key == cache_key and job.status == jobs.DONE:
+        results = job.result
+        instrumentation.add_events(results['timings'])
+        if not results['cached']:
+            st.session_state['grouping_results'] = (cache_key, results)
+        release_grouping_job(cache_key)
+        return results
+    results = result_cache.RESULTS.get(cache_key)
+    if results is None:
+        kept = st.session_state.get('grouping_results')
+        results = kept[1] if kept is not None and kept[0] == cache_key else None
+    return results
+
+# Progress of a running grouping job, and the top clusters by volume among the keywords
+# tokenized so far, updated after every shard
+def render_job_progress(job):
+    if job.stage is None:
+        st.progress(0.0, text="Waiting for a free worker..." if job.status == jobs.QUEUED else "Grouping...")
+    elif job.stage == 'reading':
+        st.progress(min(job.done, 1.0), text=f"Reading the file: {job.done:.0%}")
+    else:
+        st.progress(min(job.done / job.total, 1.0) if job.total else 1.0, text=f"{job.stage.capitalize()}: {job.done:,} of {job.total:,} {JOB_STAGE_UNITS.get(job.stage, '')}")
+
+    top_metrics = job.partial.get('top_metrics')
+    grouped = job.partial.get('grouped')
+    if grouped is not None:
+        st.caption(f"{len(grouped):,} keyword-group pairs found, aggregating their metrics...")
+    elif top_metrics is not None:
+        st.caption("Clusters of the keywords grouped so far; totals grow until grouping finishes.")
+    if top_metrics is not None:
+        metric_key, title = reports.TOP_GROUP_TABLES[0]
+        st.subheader(title)
+        table_view.render_table(reports.top_groups(top_metrics, metric_key), key=f"partial_{title}", formats=TOP_GROUP_FORMATS, page_size=20, highlight_missing=False)
+
+# Inverted index over the cluster column, built on the first search and cached with the results
+def get_keyword_index(cache_key, results, keyword_column):
+    if 'keyword_index' not in results:
+        results['keyword_index'] = KeywordIndex(results['data'][keyword_column])
+        result_cache.RESULTS.put(cache_key, results)
+    return results['keyword_index']
+
 # Streamlit user interface
 def main():
+    session_memory.track()  # Account this session's frames and reload any spilled while idle
+    instrumentation.begin_run('app1')  # Stage timings of this rerun
     check_login_state()  # Ensure the user is logged in
 
     # Display the first letter of the user's name in a circle (similar to a profile picture)
@@ -70,7 +222,11 @@ def main():
         for file in saved_files:
             if st.sidebar.button(file):
                 st.session_state.selected_file = file
+                st.session_state.pop('open_sheets', None)
                 st.experimental_rerun()
+            sheets = describe_saved_file(file)
+            if sheets is not None:
+                st.sidebar.caption(f"{len(sheets)} sheets, {sum(sheet['rows'] for sheet in sheets):,} rows, {sum(sheet['bytes'] for sheet in sheets) / 1024:,.0f} KB")
     else:
         st.sidebar.write("No saved files found.")
 
@@ -79,302 +235,291 @@ def main():
 
     # If a file is selected, load and display the saved computation state
     if 'selected_file' in st.session_state:
-        st.subheader(f"Resuming from {st.session_state.selected_file}")
-        computations = load_computation_state(st.session_state.selected_file)
-        for sheet_name, sheet_df in computations.items():
-            st.write(f"### {sheet_name}")
-            st.dataframe(sheet_df)
-
-    # Default stop words in English
-    default_stop_words = set([
-        'and', 'but', 'is', 'the', 'to', 'in', 'for', 'on', 'with', 'as', 'by', 'at', 'from',
-        'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above',
-        'below', 'up', 'down', 'out', 'off', 'over', 'under', 'again', 'further', 'then', 'once',
-        'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',
-        'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than',
-        'too', 'very', 's', 't', 'can', 'will', 'just', 'don', 'should', 'now'
-    ])
+        selected_file = st.session_state.selected_file
+        st.subheader(f"Resuming from {selected_file}")
+        sheets = describe_saved_file(selected_file)
+        if sheets is None:
+            # Pickled states from older versions can only be loaded whole
+            computations = load_computation_state(selected_file)
+            for sheet_name, sheet_df in computations.items():
+                st.write(f"### {sheet_name}")
+                st.dataframe(sheet_df)
+        else:
+            # Sheets are read from disk and rendered only while their box is ticked
+            for sheet in sheets:
+                label = f"{sheet['name']} ({sheet['rows']:,} rows, {sheet['bytes'] / 1024:,.0f} KB)"
+                if st.checkbox(label, key=f"open_{selected_file}_{sheet['name']}"):
+                    sheet_df = load_saved_sheet(selected_file, sheet['name'])
+                    table_view.render_table(sheet_df, key=f"saved_{selected_file}_{sheet['name']}", bounds={}, highlight_missing=False)
+                else:
+                    close_saved_sheet(selected_file, sheet['name'])
 
     # Upload CSV file for keyword with clicks
     st.subheader("⬆️ Upload Keyword CSV with Clicks")
     uploaded_file = st.file_uploader("CSV with Keyword and Clicks", type=["csv"])
 
+    job = None
     if uploaded_file is not None:
-        data = dp.read_csv_file(uploaded_file)
-        if data is not None:
+        digest = upload_digest(uploaded_file)
+        cache_key = result_cache.make_key(digest, reports.DEFAULT_STOP_WORDS, reports.NGRAM_SIZE, reports.MIN_GROUP_SIZE)
+        # Grouping runs on the job pool; widget reruns meanwhile show its progress, and later
+        # reruns reuse the cached results
+        results = grouping_results(cache_key)
+        if results is None:
+            job = grouping_job(uploaded_file, digest, cache_key, reports.DEFAULT_STOP_WORDS)
+            if job.status == jobs.DONE:
+                results = grouping_results(cache_key)
+            elif job.status == jobs.FAILED:
+                # SchemaError and unparsable files are the user's to fix; anything else is a bug
+                if isinstance(job.error, ValueError):
+                    st.error(str(job.error))
+                else:
+                    st.exception(job.error)
+            else:
+                render_job_progress(job)
+        if results is not None:
+            release_grouping_job(cache_key)
+            if results['missing_columns']:
+                st.warning(f"Columns not in this file: {', '.join(results['missing_columns'])}")
+            footprint_before, footprint_after = results['footprint']
+            st.caption(f"Memory: {footprint_before / 1024 ** 2:,.1f} MB as parsed, {footprint_after / 1024 ** 2:,.1f} MB after compacting dtypes")
+
             # Automatically map columns
             keyword_column = 'Parent Keyword'
-            clicks_column = 'Volume'
             difficulty_column = 'Difficulty'
             traffic_potential_column = 'Traffic potential'
             cpc_column = 'CPC'
 
-            # Calculate Opportunity Score
-            data = dp.calculate_opportunity_score(data, volume_column=clicks_column, difficulty_column=difficulty_column, cpc_column=cpc_column)
+            # Scored data, grouped keywords and metrics come from the result cache
+            data = results['data']
+            grouped_keyword_df = results['grouped']
+            metrics = results['metrics']
 
             # Store computations
             computations = {}
+            computations['Grouped Keywords'] = grouped_keyword_df
+            computations['Group Metrics'] = metrics
 
-            # Process the data directly
-            with st.spinner("Grouping..."):
-                grouped_keyword_df = dp.group_keyword(data, default_stop_words)
-                computations['Grouped Keywords'] = grouped_keyword_df
-
-                metrics = dp.calculate_group_metrics(data, grouped_keyword_df)
-                computations['Group Metrics'] = pd.DataFrame.from_dict(metrics, orient='index')
-
-                # Display top 20 groups by Total Volume, Avg KD, and Traffic Potential
-                def display_top_groups(metric_key, title):
-                    sorted_groups = sorted(metrics.items(), key=lambda x: x[1][metric_key], reverse=(metric_key != 'Avg. KD'))
-                    top_groups = sorted_groups[:20]
-                    top_groups_df = pd.DataFrame(top_groups, columns=['Cluster', 'Metrics'])
-                    top_groups_df[metric_key] = top_groups_df['Metrics'].map(lambda x: x[metric_key])
-                    top_groups_df['Total Volume'] = top_groups_df['Metrics'].map(lambda x: x['Total Volume'])
-                    top_groups_df['Avg. KD'] = top_groups_df['Metrics'].map(lambda x: x['Avg. KD'])
-                    top_groups_df['Traffic Potential'] = top_groups_df['Metrics'].map(lambda x: x['Traffic Potential'])
+            # Display top 20 groups by Total Volume, Avg KD, and Traffic Potential
+            def display_top_groups(metric_key, title):
+                with instrumentation.stage(f"top 20 by {metric_key}", rows_in=len(metrics)) as record:
+                    top_groups_df = reports.top_groups(metrics, metric_key)
                     st.subheader(title)
-                    st.dataframe(top_groups_df.drop(columns=['Metrics']).style.format({
-                        'Total Volume': '{:,.0f}', 'Avg. KD': '{:.2f}', 'Traffic Potential': '{:,.0f}',
-                    }).background_gradient(cmap='viridis'))
-                    computations[title] = top_groups_df.drop(columns=['Metrics'])
-
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    display_top_groups('Total Volume', "🔑 Top 20 Clusters by Volume")
-                with col2:
-                    display_top_groups('Avg. KD', "🔑 Top 20 Clusters by Avg KD")
-                with col3:
-                    display_top_groups('Traffic Potential', "🔑 Top 20 Clusters by Potential")
-
-                # Display full data with sorting options
-                st.subheader("Filter Full Sheet")
-                col_sort, col_order = st.columns(2)
-                with col_sort:
-                    sort_column = st.selectbox("Select the column to sort by:", data.columns)
-                with col_order:
-                    sort_order = st.radio("Select the order:", ["Ascending", "Descending"], index=1)
-                ascending = True if sort_order == "Ascending" else False
-                filtered_data = data.sort_values(by=sort_column, ascending=ascending)
-
-                st.subheader(f"📄 Filtered Full Sheet by {sort_column}")
-                filtered_data = filtered_data.drop(columns=['Last Update', 'First seen', '#'], errors='ignore')
-                st.dataframe(filtered_data.style.format({
-                    'Volume': '{:,.0f}', 'Difficulty': '{:.2f}', 'Traffic potential': '{:,.0f}', 'Global volume': '{:,.0f}', 'CPC': '{:.2f}', 'CPS': '{:.2f}', 'Opportunity Score': '{:.2f}'
-                }).background_gradient(cmap='viridis').applymap(lambda x: 'background-color: white; color: black;' if pd.isna(x) or x == '' else ''))
-
-                computations['Filtered Data'] = filtered_data
-
-                # Filter by keyword
-                keyword = st.text_input("📄 Sorted Full Sheet by cluster containing", help="Enter the keyword to filter cluster.", key="keyword_input")
-                if keyword:
-                    keyword_sorted_data = filtered_data[filtered_data[keyword_column].str.contains(keyword, case=False, na=False)]
-                    if not keyword_sorted_data.empty:
-                        st.subheader(f"📄 Sorted Full Sheet by cluster containing '{keyword}'")
-                        st.dataframe(keyword_sorted_data.style.format({
-                            'Volume': '{:,.0f}', 'Difficulty': '{:.2f}', 'Traffic potential': '{:,.0f}', 'Global volume': '{:,.0f}', 'CPC': '{:.2f}', 'CPS': '{:.2f}', 'Opportunity Score': '{:.2f}'
-                        }).background_gradient(cmap='viridis').applymap(lambda x: 'background-color: white; color: black;' if pd.isna(x) or x == '' else ''))
-
-                        # Store keyword filtered data
-                        computations[f"Filtered Data for '{keyword}'"] = keyword_sorted_data
-
-                        # Calculate unique counts and sum values for the filtered data
-                        def count_unique_and_sum(df):
-                            columns_for_unique_count = ['Parent Keyword', 'Keyword', 'SERP Features', 'Country']
-                            unique_counts = df[columns_for_unique_count].nunique()
-                            sum_counts = df.select_dtypes(include=[int, float]).sum()
-                            avg_difficulty = df[difficulty_column].mean()
-                            avg_cpc = df[cpc_column].mean()
-                            avg_opportunity_score = df['Opportunity Score'].mean()
-                            unique_parent_keyword = df['Parent Keyword'].unique()
-                            return unique_counts, sum_counts, unique_parent_keyword, avg_difficulty, avg_cpc, avg_opportunity_score
-
-                        unique_counts_filtered, sum_counts_filtered, unique_parent_keyword_filtered, avg_difficulty_filtered, avg_cpc_filtered, avg_opportunity_score_filtered = count_unique_and_sum(keyword_sorted_data)
-                        unique_counts_filtered_df = pd.DataFrame(unique_counts_filtered, columns=['Unique Counts']).transpose()
-                        sum_counts_filtered_df = pd.DataFrame(sum_counts_filtered, columns=['Sum Counts']).transpose()
-
-                        # Create DataFrame for average values
-                        avg_values_filtered_df = pd.DataFrame({
-                            'Avg. Difficulty': [avg_difficulty_filtered],
-                            'Avg. CPC': [avg_cpc_filtered],
-                            'Avg. Opportunity Score': [avg_opportunity_score_filtered]
-                        })
-
-                        # Convert unique parent keyword to DataFrame and transpose it for horizontal display
-                        unique_parent_keyword_filtered_df = pd.DataFrame(unique_parent_keyword_filtered, columns=['Unique Cluster'])
-
-                        # Place the tables side by side
-                        col_left, col_center, col_right = st.columns([2, 1, 2])
-                        with col_left:
-                            st.subheader("Unique Counts and Sum Counts")
-                            combined_counts_filtered_df = pd.concat([unique_counts_filtered_df, sum_counts_filtered_df])
-                            st.dataframe(combined_counts_filtered_df.style.format({
-                                'Parent Keyword': '{:,.0f}', 'Keyword': '{:,.0f}', 'SERP Features': '{:,.0f}', 'Country': '{:,.0f}',
-                                'Volume': '{:,.0f}', 'Traffic potential': '{:,.0f}', 'Global volume': '{:,.0f}', 'CPS': '{:.2f}', 'CPC': '{:.2f}', 'Difficulty': '{:.2f}', 'Opportunity Score': '{:.2f}'
-                            }).background_gradient(cmap='viridis'))
-
-                            computations['Unique Counts and Sum Counts'] = combined_counts_filtered_df
-
-                        with col_center:
-                            st.subheader("Average Values")
-                            st.dataframe(avg_values_filtered_df.style.format({
-                                'Avg. Difficulty': '{:.2f}', 'Avg. CPC': '{:.2f}', 'Avg. Opportunity Score': '{:.2f}'
-                            }).background_gradient(cmap='viridis'))
-                            computations['Average Values'] = avg_values_filtered_df
-
-                        with col_right:
-                            st.subheader("Unique Clusters")
-                            st.dataframe(unique_parent_keyword_filtered_df)
-                            computations['Unique Clusters'] = unique_parent_keyword_filtered_df
-                    else:
-                        st.write("No matches found.")
-
-                # Calculate Traffic for filtered data
-                traffic_monthly_filtered = filtered_data['Volume'].sum()
-                traffic_potential_desktop_filtered = int(traffic_monthly_filtered * 0.15)
-                traffic_potential_mobile_filtered = int(traffic_monthly_filtered * 0.10)
-
-                # Calculate Conversions for filtered data
-                conversion_rates = [1.00, 0.50, 0.25]
-                conversion_data = {
-                    "CTR": [f"{rate:.2f}%" for rate in conversion_rates],
-                    "Potential Desktop": [int(traffic_potential_desktop_filtered * (rate / 100)) for rate in conversion_rates],
-                    "Potential Mobile": [int(traffic_potential_mobile_filtered * (rate / 100)) for rate in conversion_rates]
-                }
-                conversion_df_filtered = pd.DataFrame(conversion_data)
-
-                computations['Conversions'] = conversion_df_filtered
-
-                # Section for selecting Average Order Value (AOV)
-                col_centered = st.columns([1, 1, 1])
-                with col_centered[1]:
-                    st.subheader("Select Average Order Value (AOV):")
-                    selected_aov = st.number_input(" ", min_value=0, value=100, step=1, format="%d")
-                    st.write(f"You entered AOV value: ${selected_aov}")
-
-                # Calculate Revenue for filtered data
-                high_conversion_rate = 0.10
-                medium_conversion_rate = 0.05
-                low_conversion_rate = 0.025
-
-                revenue_data = {
-                    "Ranges": ["High", "Medium", "Low"],
-                    "Potential Desktop": [
-                        f"${traffic_potential_desktop_filtered * high_conversion_rate * selected_aov:,.2f}",
-                        f"${traffic_potential_desktop_filtered * medium_conversion_rate * selected_aov:,.2f}",
-                        f"${traffic_potential_desktop_filtered * low_conversion_rate * selected_aov:,.2f}"
-                    ],
-                    "Potential Mobile": [
-                        f"${traffic_potential_mobile_filtered * high_conversion_rate * selected_aov:,.2f}",
-                        f"${traffic_potential_mobile_filtered * medium_conversion_rate * selected_aov:,.2f}",
-                        f"${traffic_potential_mobile_filtered * low_conversion_rate * selected_aov:,.2f}"
-                    ]
+                    table_view.render_table(top_groups_df, key=title, formats=TOP_GROUP_FORMATS, page_size=20, highlight_missing=False)
+                    computations[title] = top_groups_df
+                    record.rows_out = len(top_groups_df)
+
+            for column, (metric_key, title) in zip(st.columns(len(reports.TOP_GROUP_TABLES)), reports.TOP_GROUP_TABLES):
+                with column:
+                    display_top_groups(metric_key, title)
+
+            # Display full data with sorting options
+            st.subheader("Filter Full Sheet")
+            col_sort, col_order = st.columns(2)
+            with col_sort:
+                sort_column = st.selectbox("Select the column to sort by:", data.columns)
+            with col_order:
+                sort_order = st.radio("Select the order:", ["Ascending", "Descending"], index=1)
+            ascending = True if sort_order == "Ascending" else False
+            filtered_data = data.sort_values(by=sort_column, ascending=ascending)
+
+            st.subheader(f"📄 Filtered Full Sheet by {sort_column}")
+            filtered_data = filtered_data.drop(columns=['Last Update', 'First seen', '#'], errors='ignore')
+            table_view.render_table(filtered_data, key="full_sheet", bounds=results['gradient_bounds'])
+
+            computations['Filtered Data'] = filtered_data
+
+            # Filter by keyword
+            keyword = st.text_input("📄 Sorted Full Sheet by cluster containing", help="Enter the keyword to filter cluster.", key="keyword_input")
+            if keyword:
+                keyword_index = get_keyword_index(cache_key, results, keyword_column)
+                keyword_sorted_data = filter_containing(filtered_data, keyword_column, keyword, keyword_index)
+                if not keyword_sorted_data.empty:
+                    st.subheader(f"📄 Sorted Full Sheet by cluster containing '{keyword}'")
+                    table_view.render_table(keyword_sorted_data, key="keyword_sheet")
+
+                    # Store keyword filtered data
+                    computations[f"Filtered Data for '{keyword}'"] = keyword_sorted_data
+
+                    # Calculate unique counts and sum values for the filtered data
+                    def count_unique_and_sum(df):
+                        columns_for_unique_count = [column for column in ['Parent Keyword', 'Keyword', 'SERP Features', 'Country'] if column in df.columns]
+                        unique_counts = df[columns_for_unique_count].nunique()
+                        sum_counts = df.select_dtypes(include=[int, float]).sum()
+                        avg_difficulty = df[difficulty_column].mean()
+                        avg_cpc = df[cpc_column].mean()
+                        avg_opportunity_score = df['Opportunity Score'].mean()
+                        unique_parent_keyword = df['Parent Keyword'].unique()
+                        return unique_counts, sum_counts, unique_parent_keyword, avg_difficulty, avg_cpc, avg_opportunity_score
+
+                    unique_counts_filtered, sum_counts_filtered, unique_parent_keyword_filtered, avg_difficulty_filtered, avg_cpc_filtered, avg_opportunity_score_filtered = count_unique_and_sum(keyword_sorted_data)
+                    unique_counts_filtered_df = pd.DataFrame(unique_counts_filtered, columns=['Unique Counts']).transpose()
+                    sum_counts_filtered_df = pd.DataFrame(sum_counts_filtered, columns=['Sum Counts']).transpose()
+
+                    # Create DataFrame for average values
+                    avg_values_filtered_df = pd.DataFrame({
+                        'Avg. Difficulty': [avg_difficulty_filtered],
+                        'Avg. CPC': [avg_cpc_filtered],
+                        'Avg. Opportunity Score': [avg_opportunity_score_filtered]
+                    })
+
+                    # Convert unique parent keyword to DataFrame and transpose it for horizontal display
+                    unique_parent_keyword_filtered_df = pd.DataFrame(unique_parent_keyword_filtered, columns=['Unique Cluster'])
+
+                    # Place the tables side by side
+                    col_left, col_center, col_right = st.columns([2, 1, 2])
+                    with col_left:
+                        st.subheader("Unique Counts and Sum Counts")
+                        combined_counts_filtered_df = pd.concat([unique_counts_filtered_df, sum_counts_filtered_df])
+                        st.dataframe(combined_counts_filtered_df.style.format({
+                            'Parent Keyword': '{:,.0f}', 'Keyword': '{:,.0f}', 'SERP Features': '{:,.0f}', 'Country': '{:,.0f}',
+                            'Volume': '{:,.0f}', 'Traffic potential': '{:,.0f}', 'Global volume': '{:,.0f}', 'CPS': '{:.2f}', 'CPC': '{:.2f}', 'Difficulty': '{:.2f}', 'Opportunity Score': '{:.2f}'
+                        }).background_gradient(cmap='viridis'))
+
+                        computations['Unique Counts and Sum Counts'] = combined_counts_filtered_df
+
+                    with col_center:
+                        st.subheader("Average Values")
+                        st.dataframe(avg_values_filtered_df.style.format({
+                            'Avg. Difficulty': '{:.2f}', 'Avg. CPC': '{:.2f}', 'Avg. Opportunity Score': '{:.2f}'
+                        }).background_gradient(cmap='viridis'))
+                        computations['Average Values'] = avg_values_filtered_df
+
+                    with col_right:
+                        st.subheader("Unique Clusters")
+                        st.dataframe(unique_parent_keyword_filtered_df)
+                        computations['Unique Clusters'] = unique_parent_keyword_filtered_df
+                else:
+                    st.write("No matches found.")
+
+            # Calculate Traffic for filtered data
+            traffic_potential_desktop_filtered, traffic_potential_mobile_filtered = reports.traffic_potential(filtered_data['Volume'].sum())
+
+            # Calculate Conversions for filtered data
+            conversion_df_filtered = reports.conversions_table(traffic_potential_desktop_filtered, traffic_potential_mobile_filtered)
+
+            computations['Conversions'] = conversion_df_filtered
+
+            # Section for selecting Average Order Value (AOV)
+            col_centered = st.columns([1, 1, 1])
+            with col_centered[1]:
+                st.subheader("Select Average Order Value (AOV):")
+                selected_aov = st.number_input(" ", min_value=0, value=reports.DEFAULT_AOV, step=1, format="%d")
+                st.write(f"You entered AOV value: ${selected_aov}")
+
+            # Calculate Revenue for filtered data
+            revenue_df = reports.revenue_table(traffic_potential_desktop_filtered, traffic_potential_mobile_filtered, selected_aov)
+
+            computations['Revenue'] = revenue_df
+
+            # Display Traffic, Conversions, and Revenue side by side
+            col_traffic, col_conversions, col_revenue = st.columns(3)
+            with col_traffic:
+                st.subheader("TRAFFIC")
+                traffic_data_filtered = {
+                    "": ["Traffic Monthly"],
+                    "Potential Desktop": [traffic_potential_desktop_filtered],
+                    "Potential Mobile": [traffic_potential_mobile_filtered]
                 }
-
-                revenue_df = pd.DataFrame(revenue_data)
-
-                computations['Revenue'] = revenue_df
-
-                # Display Traffic, Conversions, and Revenue side by side
-                col_traffic, col_conversions, col_revenue = st.columns(3)
-                with col_traffic:
-                    st.subheader("TRAFFIC")
-                    traffic_data_filtered = {
-                        "": ["Traffic Monthly"],
-                        "Potential Desktop": [traffic_potential_desktop_filtered],
-                        "Potential Mobile": [traffic_potential_mobile_filtered]
+                traffic_df_filtered = pd.DataFrame(traffic_data_filtered)
+                st.table(traffic_df_filtered.style.set_table_styles([
+                    {
+                        'selector': 'th',
+                        'props': [
+                            ('background-color', '#ffffff'),
+                            ('color', 'black'),
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
+                        ]
+                    },
+                    {
+                        'selector': 'td',
+                        'props': [
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
+                        ]
                     }
-                    traffic_df_filtered = pd.DataFrame(traffic_data_filtered)
-                    st.table(traffic_df_filtered.style.set_table_styles([
-                        {
-                            'selector': 'th',
-                            'props': [
-                                ('background-color', '#ffffff'),
-                                ('color', 'black'),
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
-                            ]
-                        },
-                        {
-                            'selector': 'td',
-                            'props': [
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
-                            ]
-                        }
-                    ]))
-
-                with col_conversions:
-                    st.subheader("CONVERSIONS")
-                    st.table(conversion_df_filtered.style.set_table_styles([
-                        {
-                            'selector': 'th',
-                            'props': [
-                                ('background-color', '#ffffff'),
-                                ('color', 'black'),
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
-                            ]
-                        },
-                        {
-                            'selector': 'td',
-                            'props': [
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
-                            ]
-                        }
-                    ]))
-
-                with col_revenue:
-                    st.subheader("REVENUE")
-                    st.table(revenue_df.style.set_table_styles([
-                        {
-                            'selector': 'th',
-                            'props': [
-                                ('background-color', '#ffffff'),
-                                ('color', 'black'),
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
-                            ]
-                        },
-                        {
-                            'selector': 'td',
-                            'props': [
-                                ('text-align', 'center'),
-                                ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
-                            ]
-                        }
-                    ]))
-
-                # Sticky save button at the bottom right
-                st.markdown("""
-                    <style>
-                    .sticky {
-                        position: fixed;
-                        bottom: 10px;
-                        right: 10px;
-                        z-index: 9999;
-                        background-color: #4CAF50;
-                        color: white;
-                        border: none;
-                        padding: 10px 20px;
-                        border-radius: 5px;
-                        text-align: center;
-                        cursor: pointer;
-                        box-shadow: 0px 4px 6px rgba(0, 0, 0, 0.1);
+                ]))
+
+            with col_conversions:
+                st.subheader("CONVERSIONS")
+                st.table(conversion_df_filtered.style.set_table_styles([
+                    {
+                        'selector': 'th',
+                        'props': [
+                            ('background-color', '#ffffff'),
+                            ('color', 'black'),
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
+                        ]
+                    },
+                    {
+                        'selector': 'td',
+                        'props': [
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
+                        ]
                     }
-                    .sticky:hover {
-                        background-color: #45a049;
+                ]))
+
+            with col_revenue:
+                st.subheader("REVENUE")
+                st.table(revenue_df.style.set_table_styles([
+                    {
+                        'selector': 'th',
+                        'props': [
+                            ('background-color', '#ffffff'),
+                            ('color', 'black'),
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table headers
+                        ]
+                    },
+                    {
+                        'selector': 'td',
+                        'props': [
+                            ('text-align', 'center'),
+                            ('box-shadow', '2px 2px 5px rgba(0, 0, 0, 0.3)')  # Add shadow to table cells
+                        ]
                     }
-                    </style>
-                    <button class="sticky" onclick="document.getElementById('save-button').click()">Save Computations</button>
-                """, unsafe_allow_html=True)
-
-                if st.button("Save Computations", key='save-button'):
-                    save_computation_state(computations)
+                ]))
+
+            # Sticky save button at the bottom right
+            st.markdown("""
+                <style>
+                .sticky {
+                    position: fixed;
+                    bottom: 10px;
+                    right: 10px;
+                    z-index: 9999;
+                    background-color: #4CAF50;
+                    color: white;
+                    border: none;
+                    padding: 10px 20px;
+                    border-radius: 5px;
+                    text-align: center;
+                    cursor: pointer;
+                    box-shadow: 0px 4px 6px rgba(0, 0, 0, 0.1);
+                }
+                .sticky:hover {
+                    background-color: #45a049;
+                }
+                </style>
+                <button class="sticky" onclick="document.getElementById('save-button').click()">Save Computations</button>
+            """, unsafe_allow_html=True)
 
+            if st.button("Save Computations", key='save-button'):
+                save_computation_state(computations)
     else:
+        release_grouping_job()
         st.write("Please upload a CSV file.")
 
+    instrumentation.render_panel()
+
+    # Rerun shortly to pick up the running job's progress and, once it finishes, its results
+    if job is not None and not job.finished:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
 if __name__ == "__main__":
     login.main()  # Check login status
     if st.session_state.logged_in:
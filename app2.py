@@ -1,7 +1,12 @@
 import streamlit as st
-import pandas as pd
 import os
-import sqlite3
+import db  # Pooled database access
+import datasets
+import filters
+import recipes
+import schemas
+import session_memory
+import instrumentation
 from datetime import datetime
 
 # Load CSV and initialize state
@@ -9,9 +14,22 @@ def load_csv():
     st.subheader("Upload Your Keyword CSV")
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
     if uploaded_file:
-        data = pd.read_csv(uploaded_file)
+        # Sessions uploading the same file share one typed, compacted frame
+        try:
+            dataset = datasets.load_dataset(uploaded_file)
+        except schemas.SchemaError as error:
+            st.error(str(error))
+            return None
+        if dataset is None:
+            st.error("Error parsing the file. Please check the encoding and the file format.")
+            return None
+        if dataset['missing_columns']:
+            st.warning(f"Columns not in this file: {', '.join(dataset['missing_columns'])}. Filters on them are ignored.")
+        data = dataset['data']
         st.session_state['data'] = data
         st.success("CSV Uploaded Successfully!")
+        footprint_before, footprint_after = dataset['footprint']
+        st.caption(f"Memory: {footprint_before / 1024 ** 2:,.1f} MB as parsed, {footprint_after / 1024 ** 2:,.1f} MB after compacting dtypes")
         return data
     return None
 
@@ -28,44 +46,27 @@ def save_computation(data, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volum
     # Automatically generate a filename if not provided
     file_name = st.text_input("Enter a name for your file", key="file_name_input")
     
+    # A recipe save stores the uploaded data once and only the filters per save
+    save_recipe = st.checkbox("Save as a filter recipe over the uploaded data", key="save_recipe_input")
+    keep_copy = save_recipe and st.checkbox("Also keep a materialized copy for faster loading", key="keep_copy_input")
+    
     if file_name:
-        file_name = f"{file_name}.csv"  # Append .csv extension to the file name
-        file_path = os.path.join(user_directory, file_name)
-        
-        # Save the DataFrame to a CSV file
-        data.to_csv(file_path, index=False)
-        
-        # Store the file information in the database along with the filters
-        conn = sqlite3.connect('allusers.db')
-        c = conn.cursor()
         user_id = st.session_state.get('user_id')
         if user_id:
-            c.execute('''
-                INSERT INTO files 
-                (user_id, file_name, file_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', 
-            (user_id, file_name, file_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword))
-            conn.commit()
+            recipes.save_filtered(user_id, user_directory, file_name, st.session_state.get('data'), data, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, st.session_state, save_recipe, keep_copy)
             st.success(f"Computation saved as {file_name}")
-        conn.close()
     else:
         st.warning("Please enter a file name.")
 
 # Function to load saved computations
 def load_saved_computations():
-    conn = sqlite3.connect('allusers.db')
-    c = conn.cursor()
     user_id = st.session_state.get('user_id')
     if user_id:
-        c.execute('''
-            SELECT file_name, file_path, timestamp, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword 
+        return db.query('''
+            SELECT file_name, file_path, timestamp, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, row_count, size_bytes, storage_mode, blob_hash, source_hash, source_path, filtered_at 
             FROM files 
             WHERE user_id = ?
         ''', (user_id,))
-        files = c.fetchall()
-        conn.close()
-        return files
     return []
 
 # Display saved computations in the UI
@@ -73,10 +74,13 @@ def display_saved_computations():
     st.subheader("Saved Computations")
     files = load_saved_computations()
     if files:
-        for file_name, file_path, timestamp, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword in files:
-            st.write(f"**{file_name}** - saved on {timestamp}")
+        for file_name, file_path, timestamp, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, row_count, size_bytes, storage_mode, blob_hash, source_hash, source_path, filtered_at in files:
+            details = f" ({row_count:,} rows, {size_bytes / 1024:,.0f} KB)" if row_count is not None else ""
+            if storage_mode == 'recipe':
+                details += " - filter recipe"
+            st.write(f"**{file_name}** - saved on {timestamp}{details}")
             if st.button(f"Load {file_name}", key=file_name):
-                data = pd.read_csv(file_path)
+                data = recipes.load_saved_data(file_path, storage_mode, source_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, filtered_at)
                 st.session_state['data'] = data
                 st.session_state['kd_from'] = kd_from
                 st.session_state['kd_to'] = kd_to
@@ -120,42 +124,10 @@ def filter_data(data):
     with col9:
         sort_parent_keyword = st.selectbox("Sort Parent Keyword", ["None", "Ascending", "Descending"], index=["None", "Ascending", "Descending"].index(st.session_state.get('sort_parent_keyword', "None")))
 
-    # Convert 'First seen' column to datetime
-    if 'First seen' in data.columns:
-        data['First seen'] = pd.to_datetime(data['First seen'], errors='coerce')
-
     # Single "Apply Filters" button at the end
     if st.button("Apply Filters"):
-        # Apply KD range filter
-        data = data[(data['Difficulty'] >= kd_from) & (data['Difficulty'] <= kd_to)]
-
-        # Apply Global Volume range filter
-        data = data[(data['Global volume'] >= gv_from) & (data['Global volume'] <= gv_to)]
-
-        # Apply Traffic Potential range filter
-        data = data[(data['Traffic potential'] >= tp_from) & (data['Traffic potential'] <= tp_to)]
-
-        # Apply Volume filter
-        if volume_filter != "All":
-            if volume_filter == "0-100":
-                data = data[(data['Volume'] > 0) & (data['Volume'] <= 100)]
-            elif volume_filter == "100-1000":
-                data = data[(data['Volume'] > 100) & (data['Volume'] <= 1000)]
-            elif volume_filter == "1000+":
-                data = data[data['Volume'] > 1000]
-
-        # Apply First Seen filter
-        if first_seen_filter != "All":
-            if first_seen_filter == "Last 30 Days":
-                data = data[data['First seen'] >= pd.Timestamp.now() - pd.DateOffset(days=30)]
-            elif first_seen_filter == "Last 6 Months":
-                data = data[data['First seen'] >= pd.Timestamp.now() - pd.DateOffset(months=6)]
-            elif first_seen_filter == "Last Year":
-                data = data[data['First seen'] >= pd.Timestamp.now() - pd.DateOffset(years=1)]
-
-        # Sort by Parent Keyword if selected
-        if sort_parent_keyword != "None":
-            data = data.sort_values(by='Parent Keyword', ascending=(sort_parent_keyword == "Ascending"))
+        # Resolve every range through the column index and materialize the result once
+        data = filters.apply_filters(data, filters.get_range_index(data, st.session_state), kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword)
 
         # Update session state with the applied filters
         st.session_state['kd_from'] = kd_from
@@ -172,6 +144,9 @@ def filter_data(data):
 
 # Main app layout
 def main():
+    # Account this session's frames and reload any spilled while it was idle
+    session_memory.track()
+    instrumentation.begin_run('app2')
     st.title("Keyword Grouper SEO App")
     
     # Sidebar Navigation
@@ -219,6 +194,8 @@ def main():
     elif nav_option == "Saved Computations":
         display_saved_computations()
 
+    instrumentation.render_panel()
+
 if __name__ == "__main__":
     st.set_page_config(layout="wide")
     main()
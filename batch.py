@@ -0,0 +1,96 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import data_processing as dp
+import datasets
+import instrumentation
+import reports
+import schemas
+import storage
+
+# Layout every input must follow; other files fail instead of grouping the wrong columns
+SCHEMA_NAME = 'ahrefs'
+
+# Run app1's scoring, grouping and metrics over a directory (or glob) of keyword exports without
+# the UI, e.g. from cron. Nothing here imports streamlit, so startup stays fast.
+#
+#   python batch.py exports/ --output reports/
+#   python batch.py "exports/*_2024-*.csv" --output reports/ --format csv --workers 8
+
+# CSV files named by a directory, a glob pattern or a single path, in sorted order
+def find_inputs(pattern):
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+# Output location for one input: a saved state named after the file, loadable by app1
+def output_path(input_path, output_directory):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_directory, stem + storage.SHEETS_SUFFIX)
+
+# Parse, score, group and save the sheets of one export. Runs in a worker process; failures
+# come back in the summary instead of stopping the other files.
+def process_file(input_path, output_directory, fmt=None, aov=reports.DEFAULT_AOV, timings=False):
+    if timings:
+        instrumentation.enable()
+        instrumentation.begin_run(os.path.basename(input_path))
+    started = time.perf_counter()
+    summary = {'input': input_path, 'output': None, 'rows': 0, 'groups': 0, 'error': None}
+    try:
+        dataset = datasets.parse_dataset(input_path, dp.file_digest(input_path), schema_name=SCHEMA_NAME)
+        if dataset is None:
+            summary['error'] = "could not parse the file; check the encoding and the file format"
+        else:
+            results = dp.run_pipeline(dataset['data'], reports.DEFAULT_STOP_WORDS, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE)
+            path = output_path(input_path, output_directory)
+            storage.save_sheets(reports.build_sheets(results, aov), path, fmt)
+            summary.update(output=path, rows=len(results['data']), groups=len(results['metrics']))
+    except schemas.SchemaError as error:
+        summary['error'] = str(error)
+    except Exception as error:
+        # One broken export must not lose the reports of the others in a nightly run
+        summary['error'] = f"{type(error).__name__}: {error}"
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+# Process every input on a pool of worker processes, one file per task, and yield each summary
+# as its file finishes
+def run(inputs, output_directory, workers=None, fmt=None, aov=reports.DEFAULT_AOV, timings=False):
+    os.makedirs(output_directory, exist_ok=True)
+    workers = min(workers or os.cpu_count() or 1, len(inputs)) or 1
+    if workers == 1:
+        for input_path in inputs:
+            yield process_file(input_path, output_directory, fmt, aov, timings)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_file, input_path, output_directory, fmt, aov, timings) for input_path in inputs]
+        for future in as_completed(futures):
+            yield future.result()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Group keyword exports and write app1's sheets for each file.")
+    parser.add_argument('inputs', help="Directory of CSV files, a glob pattern or a single CSV file")
+    parser.add_argument('--output', required=True, help="Directory receiving one <name>.sheets state per input")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per core)")
+    parser.add_argument('--format', choices=sorted(storage.EXTENSIONS), help="Table format of the sheets (default: arrow when pyarrow is installed, else csv)")
+    parser.add_argument('--aov', type=float, default=reports.DEFAULT_AOV, help="Average order value for the Revenue sheet")
+    parser.add_argument('--timings', action='store_true', help=f"Append per-stage timings to {instrumentation.LOG_PATH}")
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        sys.exit(f"No CSV files match {args.inputs}")
+
+    failed = 0
+    for summary in run(inputs, args.output, args.workers, args.format, args.aov, args.timings):
+        if summary['error']:
+            failed += 1
+            print(f"FAILED {summary['input']}: {summary['error']}", file=sys.stderr)
+        else:
+            print(f"{summary['input']} -> {summary['output']}: {summary['rows']:,} rows, {summary['groups']:,} groups in {summary['seconds']:.1f} s")
+    print(f"{len(inputs) - failed} of {len(inputs)} files processed")
+    sys.exit(1 if failed else 0)
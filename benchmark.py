@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import reports
+import schemas
+
+# Columns of an Ahrefs keyword export, in export order
+EXPORT_COLUMNS = [
+    'Keyword', 'Country', 'Difficulty', 'Volume', 'CPC', 'CPS', 'Parent Keyword',
+    'Last Update', 'SERP Features', 'Global volume', 'Traffic potential', 'First seen',
+]
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+SYLLABLES = ['ba', 'ko', 'mi', 'ta', 'ren', 'sol', 'pa', 'ge', 'lin', 'dor', 'shi', 'vex', 'ul', 'tri', 'mo', 'can']
+SERP_FEATURES = [
+    'Featured snippet', 'Image pack', 'Thumbnail', 'People also ask', 'Shopping results',
+    'Videos', 'Discussions', 'Sitelinks', 'Top stories', 'Local pack',
+]
+# Share of keywords with 1..6 words, close to the sample exports
+KEYWORD_LENGTHS = [0.06, 0.27, 0.30, 0.20, 0.11, 0.06]
+# Share of missing values per column, close to the sample exports
+MISSING_SHARES = {'Difficulty': 0.3, 'Volume': 0.1, 'CPC': 0.6, 'CPS': 0.4, 'Traffic potential': 0.3, 'First seen': 0.5}
+
+# Vocabulary of made-up words; word frequencies follow a Zipf curve like search queries do
+def make_vocabulary(rng, size=20000):
+    lengths = rng.choice([1, 2, 3, 4], size, p=[0.05, 0.35, 0.4, 0.2])
+    parts = rng.integers(0, len(SYLLABLES), (size, 4))
+    words = dict.fromkeys(''.join(SYLLABLES[part] for part in parts[i, :lengths[i]]) for i in range(size))
+    vocabulary = np.array(list(words), dtype=object)
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1) ** 1.1
+    return vocabulary, weights / weights.sum()
+
+# Distinct keywords of one to six Zipf-distributed words
+def make_keywords(rng, rows, vocabulary, weights):
+    keywords = pd.Series(dtype=object)
+    while len(keywords) < rows:
+        count = int((rows - len(keywords)) * 1.3) + 100
+        lengths = rng.choice(len(KEYWORD_LENGTHS), count, p=KEYWORD_LENGTHS) + 1
+        words = vocabulary[rng.choice(len(vocabulary), (count, len(KEYWORD_LENGTHS)), p=weights)]
+        batch = pd.Series(words[:, 0])
+        for position in range(1, len(KEYWORD_LENGTHS)):
+            longer = lengths > position
+            batch[longer] = batch[longer] + ' ' + words[longer, position]
+        keywords = pd.concat([keywords, batch]).drop_duplicates()
+    return keywords.iloc[:rows].reset_index(drop=True)
+
+# Dates as the export writes them, some replaced by the ######## placeholder
+def make_dates(rng, rows, placeholder_share):
+    days = rng.integers(0, 5 * 365, rows)
+    dates = (pd.Timestamp('2024-06-30') - pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d').to_numpy(dtype=object)
+    dates[rng.random(rows) < placeholder_share] = '########'
+    return dates
+
+# A seeded, Ahrefs-shaped keyword export with `rows` rows
+def generate_export(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    vocabulary, weights = make_vocabulary(rng)
+    keywords = make_keywords(rng, rows, vocabulary, weights)
+
+    # Parent keywords: the keyword itself, its first two words, or missing
+    first_two = keywords.str.split(' ', n=2).str[:2].str.join(' ')
+    choice = rng.random(rows)
+    parents = keywords.where(choice < 0.25, first_two).where(choice < 0.8)
+
+    # One to five distinct SERP features per keyword, in random order
+    feature_count = rng.integers(1, 6, rows)
+    shuffled = np.array(SERP_FEATURES, dtype=object)[np.argsort(rng.random((rows, len(SERP_FEATURES))), axis=1)]
+    features = pd.Series(shuffled[:, 0])
+    for position in range(1, 5):
+        more = feature_count > position
+        features[more] = features[more] + ',' + shuffled[more, position]
+    volume = np.round(rng.lognormal(5, 1.6, rows), -1)
+
+    frame = pd.DataFrame({
+        'Keyword': keywords,
+        'Country': rng.choice(['us', 'gb', 'in', 'ca', 'au'], rows, p=[0.6, 0.15, 0.1, 0.1, 0.05]),
+        'Difficulty': rng.integers(0, 101, rows).astype(float),
+        'Volume': volume,
+        'CPC': np.round(rng.lognormal(-0.5, 1.0, rows), 2),
+        'CPS': np.round(rng.uniform(0.3, 1.6, rows), 2),
+        'Parent Keyword': parents,
+        'Last Update': make_dates(rng, rows, placeholder_share=0.7),
+        'SERP Features': features.where(rng.random(rows) > 0.4),
+        'Global volume': np.round(volume * rng.uniform(1, 30, rows), -1),
+        'Traffic potential': np.round(volume * rng.lognormal(0.5, 1.0, rows), -1),
+        'First seen': make_dates(rng, rows, placeholder_share=0.0),
+    }, columns=EXPORT_COLUMNS)
+    for column, share in MISSING_SHARES.items():
+        frame.loc[rng.random(rows) < share, column] = np.nan
+    return frame
+
+# Run one stage `repeat` times for the best wall time, then once more under tracemalloc
+# for the peak of Python-visible allocations (numpy and pandas buffers included).
+# `setup` builds fresh inputs so stages that mutate their frame start clean each time.
+def measure(name, stage, setup, repeat):
+    timings = []
+    for _ in range(repeat):
+        inputs = setup()
+        started = time.perf_counter()
+        result = stage(*inputs)
+        timings.append(time.perf_counter() - started)
+    inputs = setup()
+    tracemalloc.start()
+    stage(*inputs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'stage': name, 'seconds': min(timings), 'seconds_all': timings, 'peak_bytes': peak, 'rows_out': len(result)}
+
+# Time every pipeline stage on one generated export of `rows` rows. Grouping uses the stop
+# words and settings of the app, batch runner and API, so it times the groups they produce.
+def benchmark_size(rows, seed=0, repeat=3, workers=1, stop_words=reports.DEFAULT_STOP_WORDS):
+    export = generate_export(rows, seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'export.csv')
+        export.to_csv(path, index=False)
+        csv_bytes = os.path.getsize(path)
+        stages = [measure('read_csv_file', dp.read_csv_file, lambda: (path,), repeat)]
+        raw = dp.read_csv_file(path)
+
+    typed, _ = schemas.coerce_frame(raw)
+    compact = dp.compact_frame(typed)
+    scored = dp.calculate_opportunity_score(compact.copy(deep=False))
+    grouped = dp.group_keyword(scored.copy(deep=False), stop_words, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE, workers=workers)
+    stages += [
+        measure('coerce_frame', lambda df: schemas.coerce_frame(df)[0], lambda: (raw,), repeat),
+        measure('compact_frame', dp.compact_frame, lambda: (typed,), repeat),
+        measure('calculate_opportunity_score', dp.calculate_opportunity_score, lambda: (compact.copy(deep=False),), repeat),
+        measure('group_keyword', lambda df: dp.group_keyword(df, stop_words, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE, workers=workers), lambda: (scored.copy(deep=False),), repeat),
+        measure('calculate_group_metrics', dp.calculate_group_metrics, lambda: (scored, grouped), repeat),
+    ]
+    for stage in stages:
+        stage['rows_in'] = rows
+    return {'rows': rows, 'csv_bytes': csv_bytes, 'stages': stages}
+
+# Environment details that make two result files comparable
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def run(sizes=DEFAULT_SIZES, seed=0, repeat=3, workers=1):
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'repeat': repeat,
+        'workers': workers,
+        'ngram_size': reports.NGRAM_SIZE,
+        'min_group_size': reports.MIN_GROUP_SIZE,
+        'stop_words': len(reports.DEFAULT_STOP_WORDS),
+        'environment': environment(),
+        'results': [benchmark_size(rows, seed, repeat, workers) for rows in sizes],
+    }
+
+# Side-by-side best times and peaks of two result files, matched on (rows, stage)
+def compare(baseline, current):
+    previous = {(size['rows'], stage['stage']): stage for size in baseline['results'] for stage in size['stages']}
+    lines = [f"{'rows':>9} {'stage':<28} {'before s':>9} {'after s':>9} {'ratio':>6} {'peak MB':>9}"]
+    for size in current['results']:
+        for stage in size['stages']:
+            before = previous.get((size['rows'], stage['stage']))
+            before_seconds = f"{before['seconds']:.3f}" if before else '-'
+            ratio = f"{stage['seconds'] / before['seconds']:.2f}" if before and before['seconds'] else '-'
+            lines.append(f"{size['rows']:>9} {stage['stage']:<28} {before_seconds:>9} {stage['seconds']:>9.3f} {ratio:>6} {stage['peak_bytes'] / 1024 ** 2:>9.1f}")
+    return '\n'.join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the keyword pipeline on synthetic Ahrefs-shaped exports.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.seed, args.repeat, args.workers)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            print(compare(json.load(baseline_file), report))
+    elif not args.output:
+        print(json.dumps(report, indent=2))
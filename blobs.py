@@ -0,0 +1,117 @@
+import contextlib
+import hashlib
+import os
+import sys
+import threading
+import time
+import weakref
+
+import pandas as pd
+
+import db
+import storage
+
+# Saved tables live once per user under objects/, named by the content hash of the frame
+OBJECTS_DIR = 'objects'
+# Unreferenced objects younger than this may belong to a save whose row is not inserted yet
+ORPHAN_GRACE_SECONDS = 3600
+
+# One lock per stored object, so storing or reusing an object and deleting it once its last
+# reference is gone cannot interleave. A lock lives only while some thread holds on to it.
+_object_guard = threading.Lock()
+_object_locks = weakref.WeakValueDictionary()
+
+# Content hash of a frame: column names and dtypes plus a hash of every row. The index is left
+# out, as it is when the frame is stored.
+def frame_digest(df):
+    digest = hashlib.sha256()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Hold the locks of a user's objects, e.g. from storing them until the row referencing them is
+# inserted. Locks are taken in digest order so two saves sharing objects cannot deadlock.
+@contextlib.contextmanager
+def locked(user_directory, *digests):
+    objects_dir = os.path.abspath(os.path.join(user_directory, OBJECTS_DIR))
+    with _object_guard:
+        locks = [_object_locks.setdefault((objects_dir, digest), threading.RLock()) for digest in sorted(set(digests))]
+    with contextlib.ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+# Existing object of a digest in any storage format, or None
+def find_object(user_directory, digest):
+    for fmt in storage.EXTENSIONS:
+        path = os.path.join(user_directory, OBJECTS_DIR, digest + storage.extension(fmt))
+        if os.path.exists(path):
+            return path
+    return None
+
+# Store a frame once per user under its content hash and return (digest, path). Saving data
+# that is already stored, e.g. a repeated upload or an unchanged dataset, writes nothing.
+def put_frame(df, user_directory, digest=None):
+    digest = digest or frame_digest(df)
+    with locked(user_directory, digest):
+        path = find_object(user_directory, digest)
+        if path is None:
+            os.makedirs(os.path.join(user_directory, OBJECTS_DIR), exist_ok=True)
+            path = os.path.join(user_directory, OBJECTS_DIR, digest + storage.extension(storage.default_format()))
+            storage.write_table(df, path, index=False)
+    return digest, path
+
+# Saved computations of the user referencing an object, as a materialized copy or a recipe source
+def reference_count(user_id, digest):
+    return db.query_one('SELECT COUNT(*) FROM files WHERE user_id = ? AND (blob_hash = ? OR source_hash = ?)', (user_id, digest, digest))[0]
+
+# Delete an object once its last reference is gone; True when storage was freed
+def release(user_id, digest, path):
+    with locked(os.path.dirname(os.path.dirname(path)), digest):
+        if reference_count(user_id, digest) or not os.path.exists(path):
+            return False
+        os.remove(path)
+        return True
+
+# Cross-check the files table against the object stores. Returns objects no row references
+# (past the grace period) and ids of rows whose data is gone: the table of a materialized
+# save or the source of a recipe. With fix=True both are removed.
+def reconcile(fix=False):
+    referenced = set()
+    missing_rows = []
+    for file_id, file_path, storage_mode, source_path in db.query('SELECT id, file_path, storage_mode, source_path FROM files'):
+        # A recipe's materialized copy is optional: loading replays the recipe without it
+        required = source_path if storage_mode == 'recipe' else file_path
+        for path in (file_path, source_path):
+            if path:
+                referenced.add(os.path.abspath(path))
+        if not required or not os.path.exists(required):
+            missing_rows.append(file_id)
+
+    orphan_objects = []
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    for (directory,) in db.query('SELECT directory FROM users'):
+        objects_dir = os.path.join(directory, OBJECTS_DIR)
+        if not os.path.isdir(objects_dir):
+            continue
+        for name in sorted(os.listdir(objects_dir)):
+            path = os.path.abspath(os.path.join(objects_dir, name))
+            if path not in referenced and os.path.getmtime(path) < cutoff:
+                orphan_objects.append(path)
+
+    if fix:
+        for path in orphan_objects:
+            os.remove(path)
+        for file_id in missing_rows:
+            db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+    return {'orphan_objects': orphan_objects, 'missing_rows': missing_rows}
+
+if __name__ == "__main__":
+    # python blobs.py [--fix]
+    fix = '--fix' in sys.argv[1:]
+    report = reconcile(fix=fix)
+    for path in report['orphan_objects']:
+        print(f"{'Removed' if fix else 'Orphan'} object: {path}")
+    for file_id in report['missing_rows']:
+        print(f"{'Deleted' if fix else 'Missing data for'} files row {file_id}")
+    print(f"{len(report['orphan_objects'])} orphan objects, {len(report['missing_rows'])} rows with missing data")
@@ -1,57 +1,361 @@
 import pandas as pd
-from collections import Counter
-import itertools
-import re
+import numpy as np
+import codecs
+import hashlib
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
-def group_keyword(df, stop_words, min_group_size=2, ngram_size=2, keyword_column='Parent Keyword'):
+import instrumentation
+
+TOKEN_PATTERN = r'\b\w+\b'
+
+SNIFF_BYTES = 64 * 1024
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+CSV_DELIMITERS = [',', '\t', ';', '|']
+
+# Below this many keywords a process pool costs more than it saves
+PARALLEL_MIN_ROWS = 200000
+# Extra shards per worker even out uneven keyword lengths
+SHARDS_PER_WORKER = 4
+# Grouping pools are started from threaded processes (Streamlit script runs, the job pool), where
+# forking can copy a lock held by another thread; workers come from a fork server instead
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Keywords tokenized between two progress reports when grouping reports progress
+PROGRESS_SHARD_ROWS = 50000
+
+# Keyword text is interned rather than made categorical: it is mostly unique and searched as text
+KEYWORD_COLUMNS = ['Keyword', 'Parent Keyword']
+# Other text columns become categoricals when at most this share of their values is distinct
+CATEGORY_MAX_RATIO = 0.5
+
+# Count whitespace-separated words across the whole keyword column in one pass
+def count_words(keywords):
+    return keywords.str.lower().str.split().explode().value_counts()
+
+# Words frequent enough to anchor a group
+def find_common_terms(word_freq, stop_words):
+    return {word for word, freq in word_freq.items() if freq > 1 and word not in stop_words and len(word) > 2}
+
+# Tokenize the keywords once and emit every qualifying (row, n-gram) pair as flat arrays
+def emit_ngram_pairs(keywords, common_terms, ngram_size=2):
+    keywords = keywords.reset_index(drop=True)
+    tokens = keywords.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+    rows = tokens.index.to_numpy()
+    words = tokens.to_numpy(dtype=object)
+    eligible = tokens.isin(common_terms).to_numpy() | tokens.str.isdigit().to_numpy(dtype=bool)
+
+    count = len(words) - ngram_size + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+
+    # An n-gram starting at token i is valid when all n tokens are eligible and belong to the same keyword
+    valid = np.ones(count, dtype=bool)
+    for offset in range(ngram_size):
+        valid &= eligible[offset:offset + count]
+        valid &= rows[offset:offset + count] == rows[:count]
+
+    starts = np.flatnonzero(valid)
+    groups = words[starts]
+    for offset in range(1, ngram_size):
+        groups = groups + " " + words[starts + offset]
+    return rows[starts], groups
+
+# Build the Group/Keyword frame in a single construction and drop undersized groups
+def build_groups(keywords, rows, groups, min_group_size=2):
+    # A keyword joins each of its groups once, like the per-keyword set in the original loop
+    pairs = pd.DataFrame({'Row': rows, 'Group': groups}).drop_duplicates()
+    grouped_keyword_df = pd.DataFrame({
+        'Group': pairs['Group'].to_numpy(dtype=object),
+        'Keyword': keywords.to_numpy(dtype=object)[pairs['Row'].to_numpy()],
+    })
+    group_sizes = grouped_keyword_df.groupby('Group')['Group'].transform('size')
+    return grouped_keyword_df[group_sizes >= min_group_size]
+
+# Split keywords into contiguous shards; returns the shards and their starting row offsets
+def shard_keywords(keywords, shards):
+    bounds = np.linspace(0, len(keywords), shards + 1).astype(int)
+    return [keywords.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])], bounds[:-1]
+
+# Tokenize and emit n-gram pairs shard by shard, in a process pool when one is given. Word
+# frequencies are merged globally before common_terms is computed, and shard results are
+# concatenated in row order, so the pairs are identical to the single-pass path for any shard
+# count. progress(stage, done, total) is called with the keywords processed after each shard,
+# and on_pairs(rows, groups) with each shard's pairs as soon as it is tokenized.
+def emit_ngram_pairs_sharded(keywords, stop_words, ngram_size=2, shards=1, pool=None, progress=None, on_pairs=None):
+    shards, offsets = shard_keywords(keywords, shards)
+    map_shards = pool.map if pool is not None else map
+    ends = offsets + [len(shard) for shard in shards]
+
+    shard_counts = []
+    for end, counts in zip(ends, map_shards(count_words, shards)):
+        shard_counts.append(counts)
+        if progress:
+            progress('counting words', int(end), len(keywords))
+    word_freq = pd.concat(shard_counts).groupby(level=0).sum()
+    common_terms = find_common_terms(word_freq, stop_words)
+
+    shard_pairs = []
+    for end, offset, pairs in zip(ends, offsets, map_shards(emit_ngram_pairs, shards, [common_terms] * len(shards), [ngram_size] * len(shards))):
+        shard_pairs.append(pairs)
+        if on_pairs:
+            on_pairs(pairs[0] + offset, pairs[1])
+        if progress:
+            progress('tokenizing', int(end), len(keywords))
+    rows = np.concatenate([shard_rows + offset for (shard_rows, _), offset in zip(shard_pairs, offsets)])
+    groups = np.concatenate([shard_groups for _, shard_groups in shard_pairs])
+    return rows, groups
+
+# Tokenize across a process pool. Queued shards are dropped if progress raises, e.g. on cancel.
+def emit_ngram_pairs_parallel(keywords, stop_words, ngram_size=2, workers=2, progress=None, on_pairs=None):
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+    try:
+        return emit_ngram_pairs_sharded(keywords, stop_words, ngram_size, workers * SHARDS_PER_WORKER, pool, progress, on_pairs)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+@instrumentation.timed('group_keyword')
+def group_keyword(df, stop_words, min_group_size=2, ngram_size=2, keyword_column='Parent Keyword', workers=1, progress=None, on_pairs=None):
     df[keyword_column] = df[keyword_column].astype(str)
-    all_words = list(itertools.chain(*df[keyword_column].str.lower().str.split()))
-    word_freq = Counter(all_words)
-    common_terms = {word for word, freq in word_freq.items() if freq > 1 and word not in stop_words and len(word) > 2}
-
-    grouped_dfs = []
-    for keyword in df[keyword_column]:
-        words = re.findall(r'\b\w+\b', keyword.lower())
-        if len(words) >= ngram_size:
-            ngrams = [tuple(words[i:i + ngram_size]) for i in range(len(words) - ngram_size + 1)]
-            groups = set()
-            for ngram in ngrams:
-                if all(term in common_terms or term.isdigit() for term in ngram):
-                    groups.add(" ".join(ngram))
-            if groups:
-                grouped_dfs.extend([pd.DataFrame({'Group': [group], 'Keyword': [keyword]}) for group in groups])
-
-    grouped_keyword_df = pd.concat(grouped_dfs, ignore_index=True)
-    filtered_groups = grouped_keyword_df.groupby('Group').filter(lambda x: len(x) >= min_group_size)
-    return filtered_groups
+    keywords = df[keyword_column].reset_index(drop=True)
+    if workers > 1 and len(keywords) >= PARALLEL_MIN_ROWS:
+        rows, groups = emit_ngram_pairs_parallel(keywords, stop_words, ngram_size, workers, progress, on_pairs)
+    elif progress or on_pairs:
+        shards = max(1, math.ceil(len(keywords) / PROGRESS_SHARD_ROWS))
+        rows, groups = emit_ngram_pairs_sharded(keywords, stop_words, ngram_size, shards, progress=progress, on_pairs=on_pairs)
+    else:
+        common_terms = find_common_terms(count_words(keywords), stop_words)
+        rows, groups = emit_ngram_pairs(keywords, common_terms, ngram_size)
+    return build_groups(keywords, rows, groups, min_group_size)
 
+# Aggregate Total Volume, Avg. KD and Traffic Potential for every group in one join + groupby
+@instrumentation.timed('calculate_group_metrics')
 def calculate_group_metrics(df, grouped_df, keyword_column='Parent Keyword', clicks_column='Volume', difficulty_column='Difficulty', traffic_potential_column='Traffic potential'):
-    metrics = {}
-    for group in grouped_df['Group'].unique():
-        keyword_in_group = grouped_df[grouped_df['Group'] == group]['Keyword'].tolist()
-        total_volume = df[df[keyword_column].isin(keyword_in_group)][clicks_column].sum()
-        avg_kd = df[df[keyword_column].isin(keyword_in_group)][difficulty_column].mean()
-        traffic_potential = df[df[keyword_column].isin(keyword_in_group)][traffic_potential_column].sum()
-        avg_traffic_potential = traffic_potential / len(keyword_in_group) if len(keyword_in_group) > 0 else 0
-        metrics[group] = {
-            'Total Volume': total_volume,
-            'Avg. KD': avg_kd,
-            'Traffic Potential': traffic_potential,
-        }
+    # Every row whose keyword is in the group counts once, however often the keyword repeats in the group
+    members = grouped_df[['Group', 'Keyword']].drop_duplicates()
+    values = df[[keyword_column, clicks_column, difficulty_column, traffic_potential_column]]
+    joined = members.merge(values, how='left', left_on='Keyword', right_on=keyword_column)
+
+    metrics = joined.groupby('Group', sort=False).agg(**{
+        'Total Volume': (clicks_column, 'sum'),
+        'Avg. KD': (difficulty_column, 'mean'),
+        'Traffic Potential': (traffic_potential_column, 'sum'),
+    })
+    metrics.index.name = None
     return metrics
 
-def calculate_opportunity_score(df, volume_column='Volume', difficulty_column='Difficulty', cpc_column='CPC'):
-    df['Opportunity Score'] = df.apply(
-        lambda row: row[volume_column] * (1 - (row[difficulty_column] / 100)) * (row[cpc_column] / 100) if row[cpc_column] else 0, axis=1
-    )
+# The metrics of calculate_group_metrics accumulated shard by shard while tokenizing. They are
+# exact for the keywords tokenized so far: a keyword's groups come from its own row, and rows
+# with the same keyword have the same groups. Groups only gain rows, so the running top
+# clusters settle on the final ones as the shards come in.
+# With publish, every added shard publishes the running top clusters as 'top_metrics'.
+class RunningGroupMetrics:
+    def __init__(self, df, min_group_size=2, publish=None, clicks_column='Volume', difficulty_column='Difficulty', traffic_potential_column='Traffic potential'):
+        self.min_group_size = min_group_size
+        self.publish = publish
+        self.volume = df[clicks_column].to_numpy(dtype=float)
+        self.difficulty = df[difficulty_column].to_numpy(dtype=float)
+        self.traffic_potential = df[traffic_potential_column].to_numpy(dtype=float)
+        self.totals = None
+
+    # Add one shard's (row, group) pairs, row positions counted over the whole frame
+    def add(self, rows, groups):
+        pairs = pd.DataFrame({'Row': rows, 'Group': groups}).drop_duplicates()
+        rows = pairs['Row'].to_numpy()
+        difficulty = self.difficulty[rows]
+        shard = pd.DataFrame({
+            'Group': pairs['Group'].to_numpy(dtype=object),
+            'Rows': 1,
+            'Total Volume': self.volume[rows],
+            'KD Sum': np.nan_to_num(difficulty),
+            'KD Count': ~np.isnan(difficulty),
+            'Traffic Potential': self.traffic_potential[rows],
+        }).groupby('Group', sort=False).sum()
+        self.totals = shard if self.totals is None else self.totals.add(shard, fill_value=0)
+        if self.publish:
+            self.publish('top_metrics', self.top())
+
+    # Metrics of the `count` groups with the most volume so far that already reach the minimum size
+    def top(self, count=20, metric_key='Total Volume'):
+        if self.totals is None:
+            return None
+        sized = self.totals[self.totals['Rows'] >= self.min_group_size].nlargest(count, metric_key)
+        metrics = pd.DataFrame({
+            'Total Volume': sized['Total Volume'],
+            'Avg. KD': sized['KD Sum'] / sized['KD Count'].where(sized['KD Count'] > 0),
+            'Traffic Potential': sized['Traffic Potential'],
+        })
+        metrics.index.name = None
+        return metrics
+
+# Built-in opportunity score. A zero CPC scores 0 while a missing CPC stays NaN,
+# exactly like the old row-wise `if row[cpc_column] else 0` check.
+def opportunity_score(df, volume_column='Volume', difficulty_column='Difficulty', cpc_column='CPC'):
+    cpc = df[cpc_column]
+    score = df[volume_column] * (1 - (df[difficulty_column] / 100)) * (cpc / 100)
+    return score.where(cpc != 0, 0)
+
+# Evaluate score formulas column-wise and attach each result as a column.
+# A formula is either a callable taking the frame and returning a Series, or a
+# pandas expression string such as "`Traffic potential` * CPS". Formulas run in
+# order, so later ones may refer to scores computed before them.
+def calculate_scores(df, formulas):
+    for name, formula in formulas.items():
+        df[name] = formula(df) if callable(formula) else df.eval(formula)
     return df
 
-def read_csv_file(uploaded_file):
-    encodings = ['utf-8', 'latin1', 'utf-16']
-    for encoding in encodings:
-        try:
-            return pd.read_csv(uploaded_file, encoding=encoding)
-        except (UnicodeDecodeError, pd.errors.ParserError):
-            continue
-    st.error("Error parsing the file. Please check the encoding and the file format.")
-    return None
+@instrumentation.timed('calculate_opportunity_score')
+def calculate_opportunity_score(df, volume_column='Volume', difficulty_column='Difficulty', cpc_column='CPC', extra_scores=None):
+    formulas = {
+        'Opportunity Score': lambda frame: opportunity_score(frame, volume_column, difficulty_column, cpc_column),
+    }
+    formulas.update(extra_scores or {})
+    return calculate_scores(df, formulas)
+
+# Score, group and aggregate a keyword frame: the pipeline behind app1's sheets. Background
+# jobs pass progress(stage, done, total) and publish(name, value), which receives each
+# result as soon as its stage finishes, and 'top_metrics', the top clusters by volume among
+# the keywords tokenized so far, after every shard.
+def run_pipeline(data, stop_words, min_group_size=2, ngram_size=2, workers=1, progress=None, publish=None):
+    data = calculate_opportunity_score(data)
+    if publish:
+        publish('data', data)
+    on_pairs = RunningGroupMetrics(data, min_group_size, publish).add if publish else None
+    grouped_keyword_df = group_keyword(data, stop_words, min_group_size, ngram_size, workers=workers, progress=progress, on_pairs=on_pairs)
+    if publish:
+        publish('grouped', grouped_keyword_df)
+    metrics = calculate_group_metrics(data, grouped_keyword_df)
+    if progress:
+        progress('aggregating groups', len(metrics), len(metrics))
+    if publish:
+        publish('metrics', metrics)
+    return {'data': data, 'grouped': grouped_keyword_df, 'metrics': metrics}
+
+# SHA-256 of a file's content, read in blocks; uploads are rewound afterwards
+def file_digest(uploaded_file, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        with open(uploaded_file, 'rb') as source:
+            for block in iter(lambda: source.read(block_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    uploaded_file.seek(0)
+    for block in iter(lambda: uploaded_file.read(block_size), b''):
+        digest.update(block)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+# Guess the text encoding from the first bytes of a file
+def detect_encoding(prefix):
+    if prefix.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    # UTF-16 without a BOM: mostly-ASCII text leaves every other byte empty
+    if prefix.count(b'\x00') > len(prefix) // 4:
+        return 'utf-16-le' if prefix[1::2].count(b'\x00') > prefix[0::2].count(b'\x00') else 'utf-16-be'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(prefix, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+# Pick the delimiter that splits the header line into the most columns
+def detect_delimiter(sample):
+    header = sample.splitlines()[0] if sample else ''
+    return max(CSV_DELIMITERS, key=header.count) if any(d in header for d in CSV_DELIMITERS) else ','
+
+# Open a path as is and read uploads already in memory, or otherwise seekable, in place; only a
+# stream that cannot seek is copied into a spooled temp file that moves to disk once it grows
+# large. Returns the source and whether it was opened here, so the caller has to close it.
+def open_csv_source(uploaded_file):
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        return open(uploaded_file, 'rb'), True
+    if hasattr(uploaded_file, 'getvalue') or uploaded_file.seekable():
+        uploaded_file.seek(0)
+        return uploaded_file, False
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    shutil.copyfileobj(uploaded_file, spool)
+    spool.seek(0)
+    return spool, True
+
+# Parse the whole source, or chunk by chunk reporting the fraction of bytes consumed
+def parse_csv(source, encoding, sep, chunksize=None, progress=None):
+    if not chunksize:
+        return pd.read_csv(source, encoding=encoding, sep=sep)
+    total_bytes = source.seek(0, os.SEEK_END)
+    source.seek(0)
+    chunks = []
+    with pd.read_csv(source, encoding=encoding, sep=sep, chunksize=chunksize) as reader:
+        for chunk in reader:
+            chunks.append(chunk)
+            if progress:
+                progress(min(source.tell() / total_bytes, 1.0) if total_bytes else 1.0)
+    return pd.concat(chunks, ignore_index=True)
+
+# Sniff encoding and delimiter from a small prefix and parse the file once.
+# Returns None when the file cannot be parsed; callers report the error.
+@instrumentation.timed('read_csv_file')
+def read_csv_file(uploaded_file, chunksize=None, progress=None):
+    source, opened = open_csv_source(uploaded_file)
+    try:
+        prefix = source.read(SNIFF_BYTES)
+        encoding = detect_encoding(prefix)
+        sep = detect_delimiter(prefix.decode(encoding, errors='ignore'))
+        # A prefix that looks like UTF-8 can still hit a stray Latin-1 byte further down
+        for attempt_encoding in dict.fromkeys([encoding, 'latin1']):
+            source.seek(0)
+            try:
+                return parse_csv(source, attempt_encoding, sep, chunksize, progress)
+            except UnicodeDecodeError:
+                continue
+            except (pd.errors.ParserError, pd.errors.EmptyDataError):
+                return None
+        return None
+    finally:
+        if opened:
+            source.close()
+        else:
+            # Uploads are rewound for the caller, as file_digest leaves them
+            source.seek(0)
+
+# Share one string object between equal values, e.g. a Parent Keyword repeated across its rows
+def intern_strings(series):
+    codes, uniques = pd.factorize(series)
+    values = np.asarray(uniques, dtype=object)[codes]
+    values[codes == -1] = np.nan
+    return pd.Series(values, index=series.index, name=series.name)
+
+# Shrink one column without changing its values: low-cardinality text becomes categorical and
+# keyword text is interned. Number columns keep their 64-bit dtypes, since score formulas
+# multiply them and a narrower integer would wrap around silently.
+def compact_column(series, keyword_columns=KEYWORD_COLUMNS):
+    if series.dtype != object:
+        return series
+    if series.name in keyword_columns:
+        return intern_strings(series)
+    if series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+        return series.astype('category')
+    return series
+
+# Compact dtypes of an uploaded frame; filters and the pipeline work on the result unchanged
+def compact_frame(df, keyword_columns=KEYWORD_COLUMNS):
+    return pd.DataFrame({column: compact_column(df[column], keyword_columns) for column in df.columns}, index=df.index)
+
+# Bytes held by a frame, counting each shared string object once; memory_usage(deep=True)
+# counts an interned string again for every row that refers to it
+def memory_footprint(df):
+    total = df.index.memory_usage()
+    for column in df.columns:
+        series = df[column]
+        if series.dtype == object:
+            values = series.to_numpy()
+            distinct = {id(value): value for value in values}
+            total += values.nbytes + sum(sys.getsizeof(value) for value in distinct.values())
+        else:
+            total += series.memory_usage(index=False, deep=True)
+    return total
@@ -0,0 +1,96 @@
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import instrumentation
+import result_cache
+import schemas
+
+# Memory budget for parsed uploads shared by every session of the server process
+DATASET_MAX_BYTES = int(os.environ.get('DATASET_CACHE_BYTES', 1024 * 1024 * 1024))
+
+# Typed, compacted upload frames keyed by the file's content hash. Entries are never modified
+# after they are cached; the least recently used go first once the budget is exceeded.
+DATASETS = result_cache.LRUCache(DATASET_MAX_BYTES)
+
+# One lock per upload being parsed, so sessions uploading the same file parse it only once
+_loading_guard = threading.Lock()
+_loading = {}
+
+# Digest of every session copy handed out, by the copy's id, for as long as the copy lives
+_copies = {}
+
+# Parse, check, coerce and compact an upload, or reuse the frame another session already
+# loaded. Returns None when the file cannot be parsed and raises schemas.SchemaError when
+# required columns are missing; otherwise a dict with 'data', 'digest', 'missing_columns'
+# and 'footprint' (bytes as parsed, bytes after compacting).
+def load_dataset(uploaded_file, digest=None, chunksize=None, progress=None):
+    digest = digest or dp.file_digest(uploaded_file)
+    entry = DATASETS.get(digest)
+    if entry is None:
+        with _loading_guard:
+            lock = _loading.setdefault(digest, threading.Lock())
+        try:
+            with lock:
+                entry = DATASETS.get(digest)
+                if entry is None:
+                    entry = parse_dataset(uploaded_file, digest, chunksize, progress)
+                    if entry is None:
+                        return None
+                    DATASETS.put(digest, entry, size=entry['footprint'][1])
+        finally:
+            # Also after a failed or cancelled parse, which a progress callback may raise into
+            with _loading_guard:
+                _loading.pop(digest, None)
+    return hand_out(entry)
+
+# Each session gets its own shallow copy: assigning a column, like the Opportunity Score the
+# pipeline adds, replaces the array in that copy only and never reaches the shared frame
+def hand_out(entry):
+    data = entry['data'].copy(deep=False)
+    _copies[id(data)] = entry['digest']
+    weakref.finalize(data, _copies.pop, id(data), None)
+    return {**entry, 'data': data}
+
+# Whether two columns hold the same array, as a shallow copy's columns do until replaced
+def shares_column(a, b):
+    if isinstance(a.dtype, pd.CategoricalDtype):
+        if not isinstance(b.dtype, pd.CategoricalDtype):
+            return False
+        a, b = a.cat.codes, b.cat.codes
+    return a.dtype == b.dtype and np.shares_memory(a.to_numpy(), b.to_numpy())
+
+# Digest of the cached dataset a frame is a session copy of, or None when it is not one, the
+# dataset has been evicted, or the session has replaced any of its columns since
+def cached_digest(frame):
+    digest = _copies.get(id(frame))
+    entry = DATASETS.get(digest) if digest else None
+    if entry is None or list(entry['data'].columns) != list(frame.columns) or len(entry['data']) != len(frame):
+        return None
+    if all(shares_column(frame[column], entry['data'][column]) for column in frame.columns):
+        return digest
+    return None
+
+# A new session copy of a cached dataset, or None once it has been evicted
+def cached_copy(digest):
+    entry = DATASETS.get(digest)
+    return None if entry is None else hand_out(entry)['data']
+
+# Parse, coerce and compact one file. With a schema_name, files of another layout raise
+# SchemaError instead of passing through untyped.
+def parse_dataset(uploaded_file, digest, chunksize=None, progress=None, schema_name=None):
+    data = dp.read_csv_file(uploaded_file, chunksize, progress)
+    if data is None:
+        return None
+    with instrumentation.stage('coerce_frame', rows_in=len(data)) as record:
+        data, missing = schemas.coerce_frame(data, schema_name)
+        record.rows_out = len(data)
+    parsed_bytes = dp.memory_footprint(data)
+    with instrumentation.stage('compact_frame', rows_in=len(data)) as record:
+        data = dp.compact_frame(data)
+        record.rows_out = len(data)
+    return {'data': data, 'digest': digest, 'missing_columns': missing, 'footprint': (parsed_bytes, dp.memory_footprint(data))}
@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+
+import migrations
+
+DB_PATH = 'allusers.db'
+
+# How long a writer waits on a locked database before giving up
+BUSY_TIMEOUT_MS = 10000
+# Compiled statements kept per connection; the app issues a few dozen distinct queries
+STATEMENT_CACHE_SIZE = 256
+# Idle connections kept for reuse; extras are closed
+MAX_IDLE_CONNECTIONS = 8
+
+# Connection pool: each thread holds one connection while it is alive. Streamlit runs every
+# script rerun on a fresh thread, so connections of finished threads go back to an idle list
+# and are handed to new threads instead of reopening the database each time.
+_pool_lock = threading.Lock()
+_in_use = {}
+_idle = []
+# Database paths already brought up to the latest schema by this process
+_migrated = set()
+
+# Open a connection set up for concurrent sessions: WAL journaling so readers never block
+# the writer, a busy timeout instead of immediate "database is locked" errors, and a larger
+# prepared-statement cache
+def connect(path=None):
+    conn = sqlite3.connect(path or DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+# The calling thread's pooled connection
+def get_connection():
+    thread = threading.current_thread()
+    with _pool_lock:
+        conn = _in_use.get(thread)
+        if conn is None:
+            _reclaim_finished()
+            conn = _idle.pop() if _idle else connect()
+            # The first connection of the process applies pending schema migrations
+            if DB_PATH not in _migrated:
+                migrations.migrate(conn)
+                _migrated.add(DB_PATH)
+            _in_use[thread] = conn
+    return conn
+
+def _reclaim_finished():
+    for thread in [thread for thread in _in_use if not thread.is_alive()]:
+        conn = _in_use.pop(thread)
+        if len(_idle) < MAX_IDLE_CONNECTIONS:
+            _idle.append(conn)
+        else:
+            conn.close()
+
+# Run a read and return all rows
+def query(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+# Run a read and return the first row, or None
+def query_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+# Run a write in its own transaction; returns the cursor so callers can read lastrowid/rowcount
+def execute(sql, params=()):
+    conn = get_connection()
+    with conn:
+        return conn.execute(sql, params)
+
+# Close every pooled connection, e.g. before pointing DB_PATH at another database
+def close_all():
+    with _pool_lock:
+        for conn in list(_in_use.values()) + _idle:
+            conn.close()
+        _in_use.clear()
+        _idle.clear()
+        _migrated.clear()
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+# Concurrency test for db.py: many threads save and list files at once through db.execute and
+# db.query, the way concurrent Streamlit sessions do, against a temporary database. Fails on any
+# "database is locked" error or when rows go missing. Keeps the pooling, WAL journaling and busy
+# timeout behavior from regressing.
+#
+#   python db_concurrency_test.py
+#   python db_concurrency_test.py --threads 32 --saves 200
+
+# One session: register a user, then alternate saving a file with listing the user's files,
+# as the save and sidebar code paths do
+def run_session(session, saves, errors):
+    try:
+        user_id = db.execute(
+            'INSERT INTO users (first_name, last_name, phone_no, email, password, directory) VALUES (?, ?, ?, ?, ?, ?)',
+            (f'User {session}', 'Test', '0', f'user{session}@example.com', 'x', f'./user_data/user{session}@example.com'),
+        ).lastrowid
+        for save in range(saves):
+            db.execute(
+                'INSERT INTO files (user_id, file_name, file_path, kd_from, kd_to) VALUES (?, ?, ?, ?, ?)',
+                (user_id, f'save {save}', f'./user_data/user{session}/save_{save}.arrow', 0, 100),
+            )
+            listed = db.query('SELECT id, file_name FROM files WHERE user_id = ? ORDER BY id', (user_id,))
+            if len(listed) != save + 1:
+                errors.append(f"session {session}: listed {len(listed)} files after {save + 1} saves")
+    except sqlite3.OperationalError as error:
+        errors.append(f"session {session}: {error}")
+
+def run(threads, saves):
+    with tempfile.TemporaryDirectory() as directory:
+        previous_path = db.DB_PATH
+        db.close_all()
+        db.DB_PATH = os.path.join(directory, 'concurrency.db')
+        errors = []
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(run_session, range(threads), [saves] * threads, [errors] * threads))
+            elapsed = time.perf_counter() - started
+
+            users = db.query_one('SELECT COUNT(*) FROM users')[0]
+            files = db.query_one('SELECT COUNT(*) FROM files')[0]
+            journal_mode = db.query_one('PRAGMA journal_mode')[0]
+        finally:
+            db.close_all()
+            db.DB_PATH = previous_path
+
+    if users != threads:
+        errors.append(f"expected {threads} users, found {users}")
+    if files != threads * saves:
+        errors.append(f"expected {threads * saves} files, found {files}")
+    if journal_mode != 'wal':
+        errors.append(f"expected WAL journaling, found {journal_mode}")
+    return {
+        'threads': threads,
+        'saves_per_thread': saves,
+        'files': files,
+        'seconds': elapsed,
+        'locked_errors': sum('locked' in error for error in errors),
+        'errors': errors[:10],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save and list files from many threads against a temporary database.")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--saves', type=int, default=50, help="Files saved by each thread")
+    args = parser.parse_args()
+
+    report = run(args.threads, args.saves)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['errors'] else 0)
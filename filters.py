@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+# Numeric columns the Keyword Analysis filters select ranges on
+RANGE_COLUMNS = ['Difficulty', 'Global volume', 'Traffic potential', 'Volume', 'First seen']
+
+# Volume dropdown choices as (lower, upper); the lower bound is exclusive
+VOLUME_RANGES = {
+    "0-100": (0, 100),
+    "100-1000": (100, 1000),
+    "1000+": (1000, None),
+}
+
+# First Seen dropdown choices as offsets back from now
+FIRST_SEEN_OFFSETS = {
+    "Last 30 Days": pd.DateOffset(days=30),
+    "Last 6 Months": pd.DateOffset(months=6),
+    "Last Year": pd.DateOffset(years=1),
+}
+
+# Per-column sort order of a frame. A value range resolves to a contiguous slice of the
+# sort order with two searchsorted calls, so no boolean mask over the whole frame is built.
+# Missing values are left out of the order, matching comparisons against NaN/NaT.
+class ColumnRangeIndex:
+    def __init__(self, frame, columns=RANGE_COLUMNS):
+        self.frame = frame
+        self._orders = {}
+        self._sorted = {}
+        for column in columns:
+            if column not in frame.columns:
+                continue
+            values = column_values(frame[column])
+            present = np.flatnonzero(~pd.isna(values))
+            order = present[np.argsort(values[present], kind='stable')]
+            self._orders[column] = order
+            self._sorted[column] = values[order]
+
+    # Row positions whose value lies between lower and upper; either bound may be None
+    def lookup(self, column, lower=None, upper=None, lower_inclusive=True, upper_inclusive=True):
+        values = self._sorted[column]
+        start = 0
+        end = len(values)
+        if lower is not None:
+            start = np.searchsorted(values, np.asarray(lower, dtype=values.dtype), side='left' if lower_inclusive else 'right')
+        if upper is not None:
+            end = np.searchsorted(values, np.asarray(upper, dtype=values.dtype), side='right' if upper_inclusive else 'left')
+        return self._orders[column][start:end]
+
+# Comparable numpy values for a column: datetimes stay datetime64, everything else becomes float
+def column_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype='datetime64[ns]')
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+
+# Sorted positions of the rows present in every one of the position arrays
+def intersect_positions(row_count, position_sets):
+    hits = np.zeros(row_count, dtype=np.uint8)
+    for positions in position_sets:
+        hits[positions] += 1
+    return np.flatnonzero(hits == len(position_sets))
+
+# Apply the Keyword Analysis filters: every range resolves through the index, the ranges
+# are intersected once and the filtered frame is materialized a single time. Relative First
+# Seen ranges count back from `now`, the current time unless a recipe replays an older save.
+@instrumentation.timed('apply_filters')
+def apply_filters(data, range_index, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, now=None):
+    position_sets = [
+        range_index.lookup('Difficulty', kd_from, kd_to),
+        range_index.lookup('Global volume', gv_from, gv_to),
+        range_index.lookup('Traffic potential', tp_from, tp_to),
+    ]
+    if volume_filter != "All":
+        lower, upper = VOLUME_RANGES[volume_filter]
+        position_sets.append(range_index.lookup('Volume', lower, upper, lower_inclusive=False))
+    # Exports without First seen were flagged at upload; the filter does not apply to them
+    if first_seen_filter != "All" and 'First seen' in data.columns:
+        since = (pd.Timestamp.now() if now is None else now) - FIRST_SEEN_OFFSETS[first_seen_filter]
+        position_sets.append(range_index.lookup('First seen', since))
+
+    data = data.iloc[intersect_positions(len(data), position_sets)]
+
+    if sort_parent_keyword != "None":
+        data = data.sort_values(by='Parent Keyword', ascending=(sort_parent_keyword == "Ascending"))
+    return data
+
+# Sorted per-column index of a session's data, kept in `state` (the session state) and rebuilt
+# only when a different frame is loaded
+def get_range_index(data, state):
+    range_index = state.get('range_index')
+    if range_index is None or range_index.frame is not data:
+        range_index = ColumnRangeIndex(data)
+        state['range_index'] = range_index
+    return range_index
@@ -0,0 +1,99 @@
+import argparse
+import glob
+import itertools
+import re
+import sys
+from collections import Counter
+
+import pandas as pd
+
+import data_processing as dp
+import reports
+
+# Regression check: the vectorized group_keyword must produce exactly the (Group, Keyword) pairs
+# of the original per-keyword loop on the sample files, for every ngram and min-group setting
+# below. Exits non-zero on any difference.
+#
+#   python grouping_check.py
+#   python grouping_check.py path/to/export.csv --ngram-sizes 1 2 3 4
+
+SAMPLE_FILES = ['saved_computations/filtered_keywords.csv', 'user_data/*/*.csv']
+NGRAM_SIZES = [1, 2, 3]
+MIN_GROUP_SIZES = [1, 2, 3]
+# Shard size used to also check the sharded path that reports progress; small enough that the
+# sample files span several shards
+CHECK_SHARD_ROWS = 500
+
+# The loop group_keyword replaced, kept verbatim apart from returning an empty frame when no
+# keyword has a qualifying n-gram (pd.concat of nothing raised)
+def reference_group_keyword(df, stop_words, min_group_size=2, ngram_size=2, keyword_column='Parent Keyword'):
+    df[keyword_column] = df[keyword_column].astype(str)
+    all_words = list(itertools.chain(*df[keyword_column].str.lower().str.split()))
+    word_freq = Counter(all_words)
+    common_terms = {word for word, freq in word_freq.items() if freq > 1 and word not in stop_words and len(word) > 2}
+
+    grouped_dfs = []
+    for keyword in df[keyword_column]:
+        words = re.findall(r'\b\w+\b', keyword.lower())
+        if len(words) >= ngram_size:
+            ngrams = [tuple(words[i:i + ngram_size]) for i in range(len(words) - ngram_size + 1)]
+            groups = set()
+            for ngram in ngrams:
+                if all(term in common_terms or term.isdigit() for term in ngram):
+                    groups.add(" ".join(ngram))
+            if groups:
+                grouped_dfs.extend([pd.DataFrame({'Group': [group], 'Keyword': [keyword]}) for group in groups])
+
+    if not grouped_dfs:
+        return pd.DataFrame(columns=['Group', 'Keyword'])
+    grouped_keyword_df = pd.concat(grouped_dfs, ignore_index=True)
+    return grouped_keyword_df.groupby('Group').filter(lambda x: len(x) >= min_group_size)
+
+# (Group, Keyword) pairs with their multiplicity; the loop emitted a keyword's groups in set
+# order, so only the multiset of pairs is comparable
+def pair_counts(grouped_df):
+    return Counter(zip(grouped_df['Group'], grouped_df['Keyword']))
+
+# Differences for one file, as readable lines; empty when every setting matches
+def check_file(path, stop_words, ngram_sizes=NGRAM_SIZES, min_group_sizes=MIN_GROUP_SIZES):
+    df = dp.read_csv_file(path)
+    if df is None:
+        return [f"{path}: could not be parsed"]
+    problems = []
+    for ngram_size, min_group_size in itertools.product(ngram_sizes, min_group_sizes):
+        expected = pair_counts(reference_group_keyword(df.copy(), stop_words, min_group_size, ngram_size))
+        variants = {
+            'single pass': dp.group_keyword(df.copy(), stop_words, min_group_size, ngram_size),
+            'sharded': dp.group_keyword(df.copy(), stop_words, min_group_size, ngram_size, progress=lambda *_: None),
+        }
+        for name, grouped in variants.items():
+            actual = pair_counts(grouped)
+            if actual != expected:
+                missing, extra = expected - actual, actual - expected
+                problems.append(
+                    f"{path} ngram={ngram_size} min_group={min_group_size} {name}: "
+                    f"{sum(missing.values())} pairs missing, {sum(extra.values())} extra, "
+                    f"e.g. {list(missing or extra)[:3]}"
+                )
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check group_keyword against the original loop on sample files.")
+    parser.add_argument('files', nargs='*', help="CSV files to check (default: the repository's sample files)")
+    parser.add_argument('--ngram-sizes', type=int, nargs='+', default=NGRAM_SIZES)
+    parser.add_argument('--min-group-sizes', type=int, nargs='+', default=MIN_GROUP_SIZES)
+    args = parser.parse_args()
+
+    dp.PROGRESS_SHARD_ROWS = CHECK_SHARD_ROWS
+    paths = sorted(path for pattern in (args.files or SAMPLE_FILES) for path in glob.glob(pattern))
+    if not paths:
+        sys.exit("No sample files found")
+
+    problems = []
+    for path in paths:
+        file_problems = check_file(path, reports.DEFAULT_STOP_WORDS, args.ngram_sizes, args.min_group_sizes)
+        print(f"{'FAIL' if file_problems else 'ok  '} {path}")
+        problems += file_problems
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,129 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Per-stage timing is off unless PIPELINE_TIMING is set; disabled stages cost one flag check
+ENABLED = os.environ.get('PIPELINE_TIMING', '') not in ('', '0')
+# Stage events are appended here as JSON lines
+LOG_PATH = os.environ.get('PIPELINE_TIMING_LOG', 'pipeline_timings.jsonl')
+
+_log_lock = threading.Lock()
+# Events of the script run executing on this thread
+_run = threading.local()
+
+# One timed stage; callers may set rows_out inside the `with` block
+class StageRecord:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+# Resident memory of the process in bytes, or None where /proc is unavailable
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+# Start a new run on this thread, e.g. at the top of a Streamlit script run
+def begin_run(label=None):
+    _run.run_id = uuid.uuid4().hex[:12]
+    _run.label = label
+    _run.events = []
+
+# Events recorded on this thread since begin_run
+def run_events():
+    return list(getattr(_run, 'events', []))
+
+# Show events recorded on another thread, e.g. by a background job, in this thread's run.
+# They were logged when recorded and are not logged again.
+def add_events(events):
+    if hasattr(_run, 'events'):
+        _run.events.extend(events)
+
+# Stand-in for stage() while timing is off: no clock reads and no allocation per block
+class _DisabledStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_DISABLED_STAGE = _DisabledStage()
+
+# Time a block: wall time, rows in/out and the change in resident memory
+def stage(name, rows_in=None):
+    return _timed_stage(name, rows_in) if ENABLED else _DISABLED_STAGE
+
+@contextmanager
+def _timed_stage(name, rows_in=None):
+    record = StageRecord(name, rows_in)
+    rss_before = current_rss()
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        rss_after = current_rss()
+        record_event({
+            'stage': record.name,
+            'seconds': seconds,
+            'rows_in': record.rows_in,
+            'rows_out': record.rows_out,
+            'memory_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        })
+
+# Decorator timing every call of a function; rows are the lengths of the first argument and
+# of the result when they have one
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            rows_in = len(args[0]) if args and hasattr(args[0], '__len__') and not isinstance(args[0], str) else None
+            with stage(name, rows_in) as record:
+                result = function(*args, **kwargs)
+                record.rows_out = len(result) if hasattr(result, '__len__') and not isinstance(result, (str, dict)) else None
+            return result
+        return wrapper
+    return decorate
+
+def record_event(event):
+    event = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'run_id': getattr(_run, 'run_id', None),
+        'label': getattr(_run, 'label', None),
+        **event,
+    }
+    if hasattr(_run, 'events'):
+        _run.events.append(event)
+    with _log_lock:
+        with open(LOG_PATH, 'a') as log_file:
+            log_file.write(json.dumps(event) + '\n')
+
+# Collapsible sidebar table of this run's stages. Streamlit is imported here so the module
+# stays usable from scripts that never load the UI.
+def render_panel():
+    if not ENABLED:
+        return
+    import pandas as pd
+    import streamlit as st
+
+    events = run_events()
+    with st.sidebar.expander(f"Timings ({sum(event['seconds'] for event in events):.2f} s)", expanded=False):
+        if not events:
+            st.write("No stages ran in this rerun.")
+            return
+        table = pd.DataFrame(events, columns=['label', 'stage', 'seconds', 'rows_in', 'rows_out', 'memory_delta_bytes'])
+        table['memory_delta_mb'] = table.pop('memory_delta_bytes') / 1024 ** 2
+        st.dataframe(table.style.format({'seconds': '{:.3f}', 'rows_in': '{:,.0f}', 'rows_out': '{:,.0f}', 'memory_delta_mb': '{:+,.1f}'}, na_rep=''))
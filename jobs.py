@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import result_cache
+
+# Jobs running at the same time across every session of the server process
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+# Finished jobs are forgotten this long after they end; their results live on in the caches
+JOB_RETENTION_SECONDS = 600
+# Memory budget for the results of finished jobs; the least recently read jobs are forgotten
+# first once it is exceeded
+JOB_RESULT_MAX_BYTES = int(os.environ.get('JOB_RESULT_BYTES', 256 * 1024 * 1024))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Raised inside a job's function by Job.report once the job has been cancelled
+class JobCancelled(Exception):
+    pass
+
+# Raised by JobPool.submit when as many jobs as the pool allows are already queued or running
+class QueueFull(Exception):
+    pass
+
+# One unit of background work. Its function runs on a pool thread, reports progress through
+# report(), which is also where cancellation takes effect, and hands over results that are
+# ready early through publish().
+class Job:
+    def __init__(self, key, owner=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = QUEUED
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.partial = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        # Sessions waiting for this job; it is cancelled once the last one lets go
+        self.owners = {owner}
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    # Progress of the current stage, e.g. ('tokenizing', 150000, 400000); raises JobCancelled
+    # when the job has been cancelled, so long stages stop at their next report
+    def report(self, stage, done, total):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.stage, self.done, self.total = stage, done, total
+
+    def publish(self, name, value):
+        self.partial[name] = value
+
+# Background jobs on a fixed number of threads. With max_pending, at most that many jobs may be
+# queued or running at once and submit raises QueueFull beyond it, so callers can push back.
+# Finished jobs move to a cache bounded by max_result_bytes and by JOB_RETENTION_SECONDS.
+class JobPool:
+    def __init__(self, workers=JOB_WORKERS, max_pending=None, max_result_bytes=JOB_RESULT_MAX_BYTES):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        # Jobs queued or running, and finished jobs by id
+        self.jobs = {}
+        self.finished = result_cache.LRUCache(max_result_bytes)
+
+    # Jobs queued or running
+    def pending(self):
+        with self.lock:
+            return self._pending()
+
+    def _pending(self):
+        return sum(1 for job in self.jobs.values() if not job.finished)
+
+    # A job by id, or None once it is unknown, evicted or past its retention
+    def get(self, job_id, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return job
+            job = self.finished.get(job_id)
+            if job is not None and now - job.finished_at > JOB_RETENTION_SECONDS:
+                self.finished.pop(job_id)
+                return None
+            return job
+
+    # Run function(job, *args) in the background and return its Job. A session asking for work
+    # already queued or running under the same key joins that job instead of starting another.
+    def submit(self, key, function, *args, owner=None):
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and not job.finished and not job.cancelled:
+                    job.owners.add(owner)
+                    return job
+            if self.max_pending is not None and self._pending() >= self.max_pending:
+                raise QueueFull(self.max_pending)
+            job = Job(key, owner)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, function, args)
+        return job
+
+    # A session no longer needs the job, e.g. after uploading another file; cancel it when no
+    # other session is waiting on it
+    def release(self, job, owner=None):
+        with self.lock:
+            job.owners.discard(owner)
+            if not job.owners and not job.finished:
+                job.cancel()
+
+    def _run(self, job, function, args):
+        status = CANCELLED
+        if not job.cancelled:
+            job.status = RUNNING
+            try:
+                job.result = function(job, *args)
+                status = DONE
+            except JobCancelled:
+                pass
+            except Exception as error:
+                job.error = error
+                status = FAILED
+        # The final status goes last: readers seeing it finished find everything else in place
+        job.partial = {}
+        job.finished_at = time.time()
+        job.status = status
+        self.retire(job)
+
+    # Move a finished job to the bounded cache. A result bigger than the whole budget is kept
+    # anyway, in place of every other finished job, until the next job finishes.
+    def retire(self, job):
+        size = min(result_cache.estimate_size(job.result), self.finished.max_bytes)
+        with self.lock:
+            self.jobs.pop(job.id, None)
+            self.finished.put(job.id, job, size=size)
+
+# Background jobs of the server process
+JOBS = JobPool()
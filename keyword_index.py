@@ -0,0 +1,78 @@
+import re
+import sys
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+WORD_PATTERN = r'\w+'
+
+# Characters that give a search box input regex meaning under str.contains
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+# Sorts after every character that can appear in a keyword; closes a prefix range
+PREFIX_END = '\U0010ffff'
+
+# Inverted index over a keyword column: each lowercased word maps to the row positions
+# containing it, and a sorted list of every word's suffixes answers partial words
+# (any substring of a word) with two binary searches instead of a scan over the rows.
+class KeywordIndex:
+    def __init__(self, keywords):
+        self.keywords = keywords
+        # Non-string cells never match, like str.contains(..., na=False)
+        tokens = keywords.reset_index(drop=True).str.lower().str.findall(WORD_PATTERN).explode().dropna()
+        codes, vocabulary = pd.factorize(tokens)
+
+        order = np.argsort(codes, kind='stable')
+        self._rows = tokens.index.to_numpy()[order]
+        self._bounds = np.searchsorted(codes[order], np.arange(len(vocabulary) + 1))
+
+        suffixes = [(word[start:], word_id) for word_id, word in enumerate(vocabulary) for start in range(len(word))]
+        suffixes.sort()
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._suffix_words = np.array([word_id for _, word_id in suffixes], dtype=np.int64)
+
+        self.nbytes = (
+            self._rows.nbytes + self._bounds.nbytes + self._suffix_words.nbytes
+            + sum(sys.getsizeof(suffix) for suffix in self._suffixes)
+        )
+
+    # Row positions whose words contain `word` as a substring
+    def rows_containing(self, word):
+        start = bisect_left(self._suffixes, word)
+        end = bisect_left(self._suffixes, word + PREFIX_END, start)
+        word_ids = np.unique(self._suffix_words[start:end])
+        if not len(word_ids):
+            return np.empty(0, dtype=self._rows.dtype)
+        return np.unique(np.concatenate([self._rows[self._bounds[i]:self._bounds[i + 1]] for i in word_ids]))
+
+    # Index labels of keywords matching str.contains(query, case=False, na=False), or None
+    # when the query needs a full scan (regex syntax, no word characters, non-ASCII case rules)
+    def search(self, query):
+        if not query or not query.isascii() or REGEX_SPECIAL & set(query):
+            return None
+        words = re.findall(WORD_PATTERN, query.lower())
+        if not words:
+            return None
+
+        # Every word of the query must sit inside a word of a matching keyword
+        candidates = None
+        for word in sorted(set(words), key=len, reverse=True):
+            rows = self.rows_containing(word)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if not len(candidates):
+                break
+
+        subset = self.keywords.iloc[candidates]
+        # A query that is a single word is answered exactly by the word lookup
+        if words == [query.lower()]:
+            return subset.index
+        # Otherwise confirm the exact substring (spaces, punctuation, word order) on the candidates only
+        return subset.index[subset.str.contains(query, case=False, na=False).to_numpy(dtype=bool)]
+
+# Filter a frame to rows whose column contains `query`, using the index when it can answer
+def filter_containing(df, column, query, index=None):
+    labels = index.search(query) if index is not None else None
+    if labels is None:
+        return df[df[column].str.contains(query, case=False, na=False)]
+    return df[df.index.isin(labels)]
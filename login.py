@@ -2,6 +2,7 @@ import streamlit as st
 import sqlite3
 import hashlib
 import os
+import db  # Pooled database access
 import app  # Import the app module
 
 # Hash the password for security
@@ -16,39 +17,30 @@ def create_user_directory(email):
 
 # Create a new user in the database
 def create_user(first_name, last_name, phone_no, email, password):
-    conn = sqlite3.connect('allusers.db')
-    c = conn.cursor()
     # Check if the email already exists
-    c.execute('SELECT * FROM users WHERE email = ?', (email,))
-    if c.fetchone():
+    if db.query_one('SELECT id FROM users WHERE email = ?', (email,)):
         st.error("Email already exists. Please use a different one.")
-    else:
-        directory = create_user_directory(email)  # Create and get the user directory
-        c.execute('INSERT INTO users (first_name, last_name, phone_no, email, password, directory) VALUES (?, ?, ?, ?, ?, ?)', 
-                  (first_name, last_name, phone_no, email, hash_password(password), directory))
-        conn.commit()
-        st.success("User registered successfully!")
-    conn.close()
+        return
+    directory = create_user_directory(email)  # Create and get the user directory
+    try:
+        db.execute('INSERT INTO users (first_name, last_name, phone_no, email, password, directory) VALUES (?, ?, ?, ?, ?, ?)', 
+                   (first_name, last_name, phone_no, email, hash_password(password), directory))
+    except sqlite3.IntegrityError:
+        # Another session registered the same email in the meantime
+        st.error("Email already exists. Please use a different one.")
+        return
+    st.success("User registered successfully!")
 
 # Check if the login credentials are correct
 def check_login(email, password):
-    conn = sqlite3.connect('allusers.db')
-    c = conn.cursor()
-    c.execute('SELECT password FROM users WHERE email = ?', (email,))
-    stored_password = c.fetchone()
-    conn.close()
+    stored_password = db.query_one('SELECT password FROM users WHERE email = ?', (email,))
     if stored_password and stored_password[0] == hash_password(password):
         return True
     return False
 
 # Get user information after login
 def get_user_info(email):
-    conn = sqlite3.connect('allusers.db')
-    c = conn.cursor()
-    c.execute('SELECT id, first_name, last_name, directory FROM users WHERE email = ?', (email,))
-    user_info = c.fetchone()
-    conn.close()
-    return user_info
+    return db.query_one('SELECT id, first_name, last_name, directory FROM users WHERE email = ?', (email,))
 
 # Login function
 def login():
@@ -0,0 +1,135 @@
+import argparse
+import glob
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+import data_processing as dp
+import datasets
+import reports
+
+# Regression check: the vectorized calculate_group_metrics and calculate_scores must match the
+# original per-group and per-row loops on the sample files. The loops run on the file as read;
+# the vectorized code runs on the typed, compacted frame the apps, batch runner and API use, so
+# dtype changes that alter results (e.g. integer overflow in a formula) are caught too. Each
+# file is also checked with only its complete rows, and a generated export is added, because
+# number columns without gaps are the ones compacting may turn into integers.
+#
+#   python metrics_check.py
+#   python metrics_check.py path/to/export.csv --generated-rows 0
+
+SAMPLE_FILES = ['saved_computations/filtered_keywords.csv', 'user_data/*/*.csv']
+# Score formulas checked besides the opportunity score: name -> (expression, row-wise reference)
+CHECK_FORMULAS = {
+    'Volume x Global volume': ("Volume * `Global volume`", lambda row: row['Volume'] * row['Global volume']),
+    'Traffic potential x CPS': ("`Traffic potential` * CPS", lambda row: row['Traffic potential'] * row['CPS']),
+    'Volume + Traffic potential': ("Volume + `Traffic potential`", lambda row: row['Volume'] + row['Traffic potential']),
+}
+# Columns that must be present for a row to count as complete
+METRIC_COLUMNS = ['Difficulty', 'Volume', 'CPC', 'CPS', 'Global volume', 'Traffic potential']
+# Rows of the generated export; the loops are slow, so it stays small
+GENERATED_ROWS = 5000
+# Relative tolerance: sums taken in another order may differ in the last bits
+RELATIVE_TOLERANCE = 1e-9
+
+# The loop calculate_group_metrics replaced, kept verbatim apart from the unused average
+def reference_group_metrics(df, grouped_df, keyword_column='Parent Keyword', clicks_column='Volume', difficulty_column='Difficulty', traffic_potential_column='Traffic potential'):
+    metrics = {}
+    for group in grouped_df['Group'].unique():
+        keyword_in_group = grouped_df[grouped_df['Group'] == group]['Keyword'].tolist()
+        total_volume = df[df[keyword_column].isin(keyword_in_group)][clicks_column].sum()
+        avg_kd = df[df[keyword_column].isin(keyword_in_group)][difficulty_column].mean()
+        traffic_potential = df[df[keyword_column].isin(keyword_in_group)][traffic_potential_column].sum()
+        metrics[group] = {
+            'Total Volume': total_volume,
+            'Avg. KD': avg_kd,
+            'Traffic Potential': traffic_potential,
+        }
+    return metrics
+
+# The row-wise opportunity score calculate_opportunity_score replaced
+def reference_opportunity_score(df, volume_column='Volume', difficulty_column='Difficulty', cpc_column='CPC'):
+    return df.apply(
+        lambda row: row[volume_column] * (1 - (row[difficulty_column] / 100)) * (row[cpc_column] / 100) if row[cpc_column] else 0, axis=1
+    )
+
+# Positions where two columns of numbers differ beyond rounding; NaN matches NaN
+def mismatches(expected, actual):
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    return np.flatnonzero(~np.isclose(expected, actual, rtol=RELATIVE_TOLERANCE, atol=0, equal_nan=True))
+
+def describe(path, name, expected, actual, labels):
+    bad = mismatches(expected, actual)
+    if not len(bad):
+        return []
+    examples = [(labels[i], expected[i], actual[i]) for i in bad[:3]]
+    return [f"{path} {name}: {len(bad)} of {len(labels)} differ, e.g. {examples}"]
+
+# Differences for one file, as readable lines; empty when everything matches
+def check_file(path, stop_words):
+    raw = dp.read_csv_file(path)
+    dataset = datasets.parse_dataset(path, None)
+    if raw is None or dataset is None:
+        return [f"{path}: could not be parsed"]
+    typed = dataset['data']
+    problems = []
+
+    scored = dp.calculate_opportunity_score(typed.copy(deep=False))
+    expected = reference_opportunity_score(raw).to_numpy()
+    problems += describe(path, 'Opportunity Score', expected, scored['Opportunity Score'].to_numpy(), list(raw.index))
+
+    for name, (expression, reference) in CHECK_FORMULAS.items():
+        actual = dp.calculate_scores(typed.copy(deep=False), {name: expression})[name].to_numpy()
+        problems += describe(path, name, raw.apply(reference, axis=1).to_numpy(), actual, list(raw.index))
+
+    grouped = dp.group_keyword(typed.copy(deep=False), stop_words, reports.MIN_GROUP_SIZE, reports.NGRAM_SIZE)
+    reference = pd.DataFrame.from_dict(reference_group_metrics(raw.astype({'Parent Keyword': str}), grouped), orient='index')
+    metrics = dp.calculate_group_metrics(typed, grouped)
+    if set(metrics.index) != set(reference.index):
+        problems.append(f"{path} metrics: groups differ, {len(set(reference.index) ^ set(metrics.index))} only on one side")
+        return problems
+    metrics = metrics.loc[reference.index]
+    for column in reference.columns:
+        problems += describe(path, column, reference[column].to_numpy(), metrics[column].to_numpy(), list(reference.index))
+    return problems
+
+# CSV files to check: each file, its complete rows, and a generated export with no gaps
+def check_sources(paths, directory, generated_rows):
+    sources = []
+    for path in paths:
+        sources.append(path)
+        raw = dp.read_csv_file(path)
+        if raw is not None:
+            complete = os.path.join(directory, f"complete rows of {os.path.basename(path)}")
+            raw.dropna(subset=[column for column in METRIC_COLUMNS if column in raw.columns]).to_csv(complete, index=False)
+            sources.append(complete)
+    if generated_rows:
+        generated = os.path.join(directory, f"generated export of {generated_rows} rows.csv")
+        benchmark.generate_export(generated_rows).fillna({column: 0 for column in METRIC_COLUMNS}).to_csv(generated, index=False)
+        sources.append(generated)
+    return sources
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check group metrics and score formulas against the original loops on sample files.")
+    parser.add_argument('files', nargs='*', help="CSV files to check (default: the repository's sample files)")
+    parser.add_argument('--generated-rows', type=int, default=GENERATED_ROWS, help="Rows of the generated export; 0 skips it")
+    args = parser.parse_args()
+
+    paths = sorted(path for pattern in (args.files or SAMPLE_FILES) for path in glob.glob(pattern))
+    if not paths:
+        sys.exit("No sample files found")
+
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        for path in check_sources(paths, directory, args.generated_rows):
+            file_problems = check_file(path, reports.DEFAULT_STOP_WORDS)
+            print(f"{'FAIL' if file_problems else 'ok  '} {os.path.basename(path) if path.startswith(directory) else path}")
+            problems += file_problems
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,97 @@
+# Add a column unless it is already there, so a migration can be re-applied safely
+def add_column(conn, table, column, declaration):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+# Ordered schema migrations; never edit or reorder a released entry, append a new one.
+# Each step is an SQL statement or a callable taking the connection. Steps are idempotent so
+# databases created before versioning (user_version 0 with the tables already present)
+# migrate cleanly.
+MIGRATIONS = [
+    # 1: users and files tables, as setup_db.create_db used to create them
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            phone_no TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            directory TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            kd_from INTEGER,
+            kd_to INTEGER,
+            gv_from INTEGER,
+            gv_to INTEGER,
+            tp_from INTEGER,
+            tp_to INTEGER,
+            volume_filter TEXT,
+            first_seen_filter TEXT,
+            sort_parent_keyword TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        ''',
+    ],
+    # 2: index for the per-user file listing. The listing reads nearly every column, so a seek
+    # index beats a covering copy of the table; email lookups already use the UNIQUE index.
+    [
+        'CREATE INDEX IF NOT EXISTS idx_files_user_id ON files (user_id, id)',
+    ],
+    # 3: storage format and size of each saved file, shown in the saved computations list
+    [
+        lambda conn: add_column(conn, 'files', 'format', "TEXT DEFAULT 'csv'"),
+        lambda conn: add_column(conn, 'files', 'row_count', 'INTEGER'),
+        lambda conn: add_column(conn, 'files', 'size_bytes', 'INTEGER'),
+    ],
+    # 4: recipe saves, which reference a content-hashed source dataset plus the filters above
+    # instead of a materialized copy of the result. The (user_id, source_hash) index also serves
+    # the per-user listing, so the single-column index of step 2 goes.
+    [
+        lambda conn: add_column(conn, 'files', 'storage_mode', "TEXT DEFAULT 'materialized'"),
+        lambda conn: add_column(conn, 'files', 'source_hash', 'TEXT'),
+        lambda conn: add_column(conn, 'files', 'source_path', 'TEXT'),
+        lambda conn: add_column(conn, 'files', 'filtered_at', 'TEXT'),
+        'CREATE INDEX IF NOT EXISTS idx_files_source_hash ON files (user_id, source_hash)',
+        'DROP INDEX IF EXISTS idx_files_user_id',
+    ],
+    # 5: content hash of the stored object holding a save's table; objects are shared between
+    # rows and reference-counted through this column and source_hash
+    [
+        lambda conn: add_column(conn, 'files', 'blob_hash', 'TEXT'),
+        'CREATE INDEX IF NOT EXISTS idx_files_blob_hash ON files (user_id, blob_hash)',
+    ],
+]
+
+# Current schema version of a database
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+# Apply every pending migration in one write transaction and record the new version.
+# The version is re-read under the write lock, so concurrent processes migrate only once.
+def migrate(conn, migrations=MIGRATIONS):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = schema_version(conn)
+        for steps in migrations[version:]:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+        if len(migrations) > version:
+            conn.execute(f'PRAGMA user_version = {len(migrations)}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(migrations)
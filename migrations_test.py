@@ -0,0 +1,74 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+import migrations
+
+# Migration test: a fresh database and a copy of the pre-versioning allusers.db layout must both
+# reach the latest schema version with the expected indexes and columns, keep their rows, and
+# stay unchanged when the migrations run again.
+#
+#   python migrations_test.py
+
+LEGACY_DATABASE = 'allusers.db'
+# Bump together with the expectations below when appending a migration
+EXPECTED_VERSION = 5
+EXPECTED_INDEXES = {'idx_files_source_hash', 'idx_files_blob_hash'}
+EXPECTED_FILE_COLUMNS = {
+    'format', 'row_count', 'size_bytes', 'storage_mode', 'source_hash', 'source_path', 'filtered_at', 'blob_hash',
+}
+
+# Everything a migration can change: the version, every table, index and column, and row counts
+def snapshot(conn):
+    schema = conn.execute('SELECT type, name, sql FROM sqlite_master ORDER BY type, name').fetchall()
+    tables = [name for kind, name, _ in schema if kind == 'table' and not name.startswith('sqlite_')]
+    return {
+        'version': migrations.schema_version(conn),
+        'schema': schema,
+        'rows': {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in tables},
+    }
+
+def check_database(label, path):
+    problems = []
+    conn = sqlite3.connect(path)
+    try:
+        before = snapshot(conn)
+        migrations.migrate(conn)
+        migrated = snapshot(conn)
+        migrations.migrate(conn)
+        again = snapshot(conn)
+    finally:
+        conn.close()
+
+    if migrated['version'] != EXPECTED_VERSION:
+        problems.append(f"{label}: user_version is {migrated['version']}, expected {EXPECTED_VERSION}")
+    if again != migrated:
+        problems.append(f"{label}: running the migrations again changed the database")
+    indexes = {name for kind, name, _ in migrated['schema'] if kind == 'index' and not name.startswith('sqlite_')}
+    if indexes != EXPECTED_INDEXES:
+        problems.append(f"{label}: indexes are {sorted(indexes)}, expected {sorted(EXPECTED_INDEXES)}")
+    conn = sqlite3.connect(path)
+    try:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(files)')}
+    finally:
+        conn.close()
+    if not EXPECTED_FILE_COLUMNS <= columns:
+        problems.append(f"{label}: files lacks {sorted(EXPECTED_FILE_COLUMNS - columns)}")
+    lost = {table: count for table, count in before['rows'].items() if migrated['rows'].get(table) != count}
+    if lost:
+        problems.append(f"{label}: row counts changed for {lost}")
+    return problems
+
+if __name__ == "__main__":
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        problems += check_database('fresh database', os.path.join(directory, 'fresh.db'))
+        legacy_copy = os.path.join(directory, 'legacy.db')
+        shutil.copy(LEGACY_DATABASE, legacy_copy)
+        problems += check_database(f'copy of {LEGACY_DATABASE}', legacy_copy)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    print('ok' if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,84 @@
+import os
+
+import pandas as pd
+
+import blobs
+import db
+import filters
+import schemas
+import storage
+
+# Rebuild a recipe save: filter the source exactly as it was filtered when saved. `filtered_at`
+# pins relative First Seen ranges to the save time so a reload returns the same rows.
+def load_recipe(source_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, filtered_at=None):
+    source = read_typed(source_path)
+    now = pd.Timestamp(filtered_at) if filtered_at else None
+    result = filters.apply_filters(source, filters.ColumnRangeIndex(source), kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, now=now)
+    # Same index a materialized save gets back from storage
+    return result.reset_index(drop=True)
+
+# Data of a saved computation: the materialized copy when there is one, else the recipe
+# replayed over its source
+def load_saved_data(file_path, storage_mode, source_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, filtered_at):
+    if storage_mode == 'recipe' and not (file_path and os.path.exists(file_path)):
+        return load_recipe(source_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, filtered_at)
+    return read_typed(file_path)
+
+# Read a stored table with its dtypes. CSV tables come back as text and are coerced again;
+# Arrow and Parquet tables already carry their dtypes and are returned as read, so memory-mapped
+# columns stay mapped.
+def read_typed(path):
+    data = storage.read_table(path)
+    if storage.format_for_path(path) != 'csv':
+        return data
+    try:
+        return schemas.coerce_frame(data)[0]
+    except schemas.SchemaError:
+        return data
+
+# Content hash of a session's data, kept in `state` (the session state) and computed once per
+# loaded frame
+def get_source_digest(data, state):
+    cached = state.get('source_digest')
+    if cached is None or cached[0] is not data:
+        cached = (data, blobs.frame_digest(data))
+        state['source_digest'] = cached
+    return cached[1]
+
+# Store a save of the session's `source` data filtered as given. A recipe save stores the source
+# once under its content hash and rebuilds the result from it on load; keep_copy also stores
+# the filtered result. Tables are stored once per user under their content hash, so the file
+# name is only a label. Returns the number of rows saved.
+def save_filtered(user_id, user_directory, file_name, source, data, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, state, save_recipe=False, keep_copy=False):
+    fmt = storage.default_format()
+    file_path = ''
+    storage_mode = 'materialized'
+    blob_hash = source_hash = source_path = None
+    filtered_at = pd.Timestamp.now().isoformat()
+
+    if save_recipe:
+        source_hash = get_source_digest(source, state)
+        data = filters.apply_filters(source, filters.get_range_index(source, state), kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword)
+        storage_mode = 'recipe'
+
+    if not save_recipe or keep_copy:
+        blob_hash = get_source_digest(data, state) if data is source else blobs.frame_digest(data)
+
+    # The objects stay locked until the row referencing them is inserted, so deleting another
+    # save of the same data cannot remove them in between
+    with blobs.locked(user_directory, *[digest for digest in (source_hash, blob_hash) if digest]):
+        if source_hash:
+            _, source_path = blobs.put_frame(source, user_directory, source_hash)
+        if blob_hash:
+            # Save the DataFrame as a typed columnar table, unless identical data is already stored
+            _, file_path = blobs.put_frame(data, user_directory, blob_hash)
+        size_bytes = os.path.getsize(file_path) if file_path else 0
+
+        # Store the file information in the database along with the filters
+        db.execute('''
+            INSERT INTO files 
+            (user_id, file_name, file_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, format, row_count, size_bytes, storage_mode, blob_hash, source_hash, source_path, filtered_at) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', 
+        (user_id, file_name, file_path, kd_from, kd_to, gv_from, gv_to, tp_from, tp_to, volume_filter, first_seen_filter, sort_parent_keyword, fmt, len(data), size_bytes, storage_mode, blob_hash, source_hash, source_path, filtered_at))
+    return len(data)
@@ -0,0 +1,65 @@
+import pandas as pd
+
+# Grouping parameters shared by the app and the batch runner; part of the result cache key
+NGRAM_SIZE = 2
+MIN_GROUP_SIZE = 2
+
+# Default stop words in English
+DEFAULT_STOP_WORDS = frozenset([
+    'and', 'but', 'is', 'the', 'to', 'in', 'for', 'on', 'with', 'as', 'by', 'at', 'from',
+    'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above',
+    'below', 'up', 'down', 'out', 'off', 'over', 'under', 'again', 'further', 'then', 'once',
+    'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more',
+    'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than',
+    'too', 'very', 's', 't', 'can', 'will', 'just', 'don', 'should', 'now'
+])
+
+# Top-20 tables: (metric, sheet title). Lower is better for Avg. KD, higher for the rest.
+TOP_GROUP_TABLES = [
+    ('Total Volume', "🔑 Top 20 Clusters by Volume"),
+    ('Avg. KD', "🔑 Top 20 Clusters by Avg KD"),
+    ('Traffic Potential', "🔑 Top 20 Clusters by Potential"),
+]
+
+# Share of monthly volume expected on desktop and mobile
+DESKTOP_SHARE = 0.15
+MOBILE_SHARE = 0.10
+# Click-through rates in percent for the Conversions sheet
+CONVERSION_RATES = [1.00, 0.50, 0.25]
+# Conversion rates for the High, Medium and Low revenue ranges
+REVENUE_RATES = [('High', 0.10), ('Medium', 0.05), ('Low', 0.025)]
+DEFAULT_AOV = 100
+
+# The 20 best groups by one metric, that metric first and the cluster name as a column
+def top_groups(metrics, metric_key, count=20):
+    top = metrics.sort_values(by=metric_key, ascending=(metric_key == 'Avg. KD'), kind='stable').head(count)
+    columns = [metric_key] + [column for column in metrics.columns if column != metric_key]
+    return top[columns].rename_axis('Cluster').reset_index()
+
+# Monthly desktop and mobile traffic potential of a total search volume
+def traffic_potential(total_volume):
+    return int(total_volume * DESKTOP_SHARE), int(total_volume * MOBILE_SHARE)
+
+def conversions_table(desktop, mobile):
+    return pd.DataFrame({
+        "CTR": [f"{rate:.2f}%" for rate in CONVERSION_RATES],
+        "Potential Desktop": [int(desktop * (rate / 100)) for rate in CONVERSION_RATES],
+        "Potential Mobile": [int(mobile * (rate / 100)) for rate in CONVERSION_RATES]
+    })
+
+def revenue_table(desktop, mobile, aov=DEFAULT_AOV):
+    return pd.DataFrame({
+        "Ranges": [name for name, _ in REVENUE_RATES],
+        "Potential Desktop": [f"${desktop * rate * aov:,.2f}" for _, rate in REVENUE_RATES],
+        "Potential Mobile": [f"${mobile * rate * aov:,.2f}" for _, rate in REVENUE_RATES]
+    })
+
+# The sheets app1 saves for an upload before any keyword search, from run_pipeline's results
+def build_sheets(results, aov=DEFAULT_AOV):
+    sheets = {'Grouped Keywords': results['grouped'], 'Group Metrics': results['metrics']}
+    for metric_key, title in TOP_GROUP_TABLES:
+        sheets[title] = top_groups(results['metrics'], metric_key)
+    desktop, mobile = traffic_potential(results['data']['Volume'].sum())
+    sheets['Conversions'] = conversions_table(desktop, mobile)
+    sheets['Revenue'] = revenue_table(desktop, mobile, aov)
+    return sheets
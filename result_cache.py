@@ -0,0 +1,86 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget for cached pipeline results shared by every session of the server process
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Build a cache key from the upload's content digest and every parameter that changes the grouping
+def make_key(file_digest, stop_words, ngram_size, min_group_size):
+    digest = hashlib.sha256()
+    digest.update(file_digest.encode())
+    digest.update("\0".join(sorted(stop_words)).encode())
+    digest.update(f"{ngram_size}:{min_group_size}".encode())
+    return digest.hexdigest()
+
+# Approximate the memory held by a cached value, counting object columns deeply
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, dict):
+        return sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+# Thread-safe LRU cache bounded by the estimated memory of its entries
+class LRUCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        with self._lock:
+            self._discard(key)
+            # A value bigger than the whole budget would only evict everything else
+            if size > self.max_bytes:
+                return False
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            self._discard(key)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+# Scored frame, grouped keywords and group metrics per upload, shared across reruns
+RESULTS = LRUCache()
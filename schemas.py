@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Cell values that stand for "no value" in exports, e.g. Excel's ######## for a date too wide
+# for its column when the sheet was saved from a spreadsheet
+PLACEHOLDERS = ['########', '']
+
+# Known export layouts: column name -> kind ('text', 'number' or 'datetime'). Required columns
+# are the ones the filters and the grouping pipeline cannot run without.
+SCHEMAS = {
+    'ahrefs': {
+        'required': {
+            'Keyword': 'text',
+            'Difficulty': 'number',
+            'Volume': 'number',
+            'CPC': 'number',
+            'Parent Keyword': 'text',
+            'Global volume': 'number',
+            'Traffic potential': 'number',
+        },
+        'optional': {
+            'Country': 'text',
+            'CPS': 'number',
+            'Last Update': 'datetime',
+            'SERP Features': 'text',
+            'First seen': 'datetime',
+        },
+    },
+}
+
+# An upload that lacks columns its layout requires
+class SchemaError(ValueError):
+    def __init__(self, schema_name, missing):
+        self.schema_name = schema_name
+        self.missing = missing
+        super().__init__(f"The file is missing required columns: {', '.join(missing)}")
+
+# Every column of a schema with its kind
+def schema_columns(schema):
+    return {**schema['required'], **schema['optional']}
+
+# Name of the known layout sharing the most columns with the frame, or None
+def match_schema(columns):
+    overlaps = {name: len(set(columns) & set(schema_columns(schema))) for name, schema in SCHEMAS.items()}
+    name = max(overlaps, key=overlaps.get)
+    return name if overlaps[name] else None
+
+# Required and optional columns of the layout that the frame does not have
+def missing_columns(columns, schema_name):
+    schema = SCHEMAS[schema_name]
+    return (
+        [column for column in schema['required'] if column not in columns],
+        [column for column in schema['optional'] if column not in columns],
+    )
+
+# Convert one column to its kind; placeholders and unparsable values become NaN/NaT. A column
+# that already has its kind is returned as is.
+def coerce_column(series, kind):
+    if kind == 'datetime':
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        return pd.to_datetime(series.where(~series.isin(PLACEHOLDERS)), errors='coerce')
+    if kind == 'number':
+        if pd.api.types.is_numeric_dtype(series):
+            return series
+        # Text numbers may carry thousands separators, e.g. "1,200"
+        text = series.astype('string').str.replace(',', '', regex=False)
+        return pd.to_numeric(text, errors='coerce').astype(float)
+    if series.dtype == object:
+        placeholders = series.isin(PLACEHOLDERS)
+        return series.where(~placeholders, np.nan) if placeholders.any() else series
+    return series
+
+# Validate a freshly read frame against its layout and coerce every known column once, so
+# later reruns can rely on the dtypes. Returns (typed frame, missing optional columns);
+# raises SchemaError when required columns are missing. Unknown layouts pass through.
+def coerce_frame(df, schema_name=None):
+    schema_name = schema_name or match_schema(df.columns)
+    if schema_name is None:
+        return df, []
+    missing_required, missing_optional = missing_columns(df.columns, schema_name)
+    if missing_required:
+        raise SchemaError(schema_name, missing_required)
+    kinds = schema_columns(SCHEMAS[schema_name])
+    converted = {}
+    for column in df.columns:
+        if column in kinds:
+            series = df[column]
+            coerced = coerce_column(series, kinds[column])
+            if coerced is not series:
+                converted[column] = coerced
+    # A shallow copy: columns that needed no conversion keep sharing the caller's arrays
+    typed = df.copy(deep=False)
+    for column, values in converted.items():
+        typed[column] = values
+    return typed, missing_optional
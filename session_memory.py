@@ -0,0 +1,159 @@
+import os
+import re
+import shutil
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import data_processing as dp
+import datasets
+import storage
+
+# Sessions untouched for this long have their frames written to disk
+IDLE_SECONDS = int(os.environ.get('SESSION_IDLE_SECONDS', 15 * 60))
+# Frames smaller than this stay in memory; spilling them would save little
+SPILL_MIN_BYTES = 1024 * 1024
+# How often a rerun looks for idle sessions to spill
+SPILL_CHECK_SECONDS = 60
+SPILL_DIR = os.environ.get('SESSION_SPILL_DIR', 'session_spill')
+# Users allowed to see every session's memory, as comma-separated user ids
+ADMIN_USER_IDS = {value.strip() for value in os.environ.get('ADMIN_USER_IDS', '').split(',') if value.strip()}
+
+# Session state entries derived from the frames (indexes, cached digests). They keep the frame
+# alive, so they are dropped when it is spilled and rebuilt on the next access.
+DERIVED_KEYS = ['range_index', 'source_digest']
+
+# Every session of the process: its state, last rerun time and a lock serializing spill and
+# reload. The state object is Streamlit's per-session store, stable across reruns.
+_sessions_lock = threading.Lock()
+_sessions = {}
+_last_check = 0.0
+
+# A frame written to disk in place of the DataFrame it stood for. `digest` is set for a
+# session copy of a cached upload, which is taken from the dataset cache again while cached.
+class SpilledFrame:
+    def __init__(self, path, rows, size, digest=None):
+        self.path = path
+        self.rows = rows
+        self.size = size
+        self.digest = digest
+
+# Bytes of DataFrames and Series held by a session state value, looking inside dicts, lists
+# and tuples; frames shared with other sessions count for each of them
+def held_bytes(value):
+    if isinstance(value, pd.DataFrame):
+        return dp.memory_footprint(value)
+    if isinstance(value, pd.Series):
+        return dp.memory_footprint(value.to_frame())
+    if isinstance(value, dict):
+        return sum(held_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(held_bytes(item) for item in value)
+    return 0
+
+# Per-key bytes of one session's frames, largest first
+def session_usage(state):
+    usage = {key: held_bytes(value) for key, value in state.filtered_state.items()}
+    return sorted(((key, size) for key, size in usage.items() if size), key=lambda item: item[1], reverse=True)
+
+# Register the running session, bring back any frames spilled while it was idle, and spill
+# other sessions that went idle. Call first thing in every script run.
+def track():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    with _sessions_lock:
+        entry = _sessions.setdefault(ctx.session_id, {'state': ctx.session_state, 'lock': threading.Lock()})
+        entry['last_access'] = time.time()
+        entry['user'] = st.session_state.get('full_name') or st.session_state.get('user_id')
+    with entry['lock']:
+        restore(entry['state'])
+    spill_idle(current=ctx.session_id)
+
+# Replace every spilled entry of a session with its frame: shared again from the dataset cache
+# when it was a copy of a cached upload that is still cached, else read back from disk
+def restore(state):
+    for key, value in list(state.filtered_state.items()):
+        if isinstance(value, SpilledFrame):
+            frame = datasets.cached_copy(value.digest) if value.digest else None
+            state[key] = frame if frame is not None else storage.read_table(value.path, index_col=0)
+            os.remove(value.path)
+
+# Write the large frames of one session to columnar files and keep only their placeholders.
+# Copies of cached uploads are written too, in case the cache evicts the upload meanwhile; their
+# memory is freed once no session holds the upload and the cache lets it go.
+def spill(session_id, state):
+    directory = os.path.join(SPILL_DIR, session_id)
+    spilled = 0
+    for key, value in list(state.filtered_state.items()):
+        if not isinstance(value, pd.DataFrame) or held_bytes(value) < SPILL_MIN_BYTES:
+            continue
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', key).strip('_') or 'frame'
+        path = os.path.join(directory, slug + storage.extension(storage.default_format()))
+        storage.write_table(value, path)
+        state[key] = SpilledFrame(path, len(value), held_bytes(value), datasets.cached_digest(value))
+        spilled += 1
+    if spilled:
+        for key in DERIVED_KEYS:
+            if key in state:
+                del state[key]
+    return spilled
+
+# Spill sessions idle for longer than IDLE_SECONDS and forget sessions that have closed;
+# runs at most once per SPILL_CHECK_SECONDS across the process
+def spill_idle(now=None, current=None):
+    global _last_check
+    now = time.time() if now is None else now
+    with _sessions_lock:
+        if now - _last_check < SPILL_CHECK_SECONDS:
+            return
+        _last_check = now
+        sessions = list(_sessions.items())
+    for session_id, entry in sessions:
+        if session_id == current:
+            continue
+        if runtime.exists() and not runtime.get_instance().is_active_session(session_id):
+            with _sessions_lock:
+                _sessions.pop(session_id, None)
+            shutil.rmtree(os.path.join(SPILL_DIR, session_id), ignore_errors=True)
+        elif now - entry['last_access'] > IDLE_SECONDS and entry['lock'].acquire(blocking=False):
+            try:
+                spill(session_id, entry['state'])
+            finally:
+                entry['lock'].release()
+
+# Memory held by every tracked session: (session id, user, total bytes, per-key bytes,
+# seconds idle, spilled frames), largest first
+def session_report(now=None):
+    now = time.time() if now is None else now
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    report = []
+    for session_id, entry in sessions:
+        usage = session_usage(entry['state'])
+        spilled = [key for key, value in entry['state'].filtered_state.items() if isinstance(value, SpilledFrame)]
+        report.append((session_id, entry.get('user'), sum(size for _, size in usage), usage, now - entry['last_access'], spilled))
+    return sorted(report, key=lambda row: row[2], reverse=True)
+
+def is_admin():
+    return str(st.session_state.get('user_id')) in ADMIN_USER_IDS
+
+# Admin view of the sessions holding the most memory
+def render_admin_view(limit=20):
+    st.subheader("Session Memory")
+    report = session_report()
+    st.caption(f"{len(report)} sessions, {sum(row[2] for row in report) / 1024 ** 2:,.1f} MB of frames in memory. Frames shared through the dataset cache count for every session holding them.")
+    rows = [{
+        'Session': session_id[:8],
+        'User': user,
+        'MB': total / 1024 ** 2,
+        'Largest entries': ", ".join(f"{key} ({size / 1024 ** 2:,.1f} MB)" for key, size in usage[:3]),
+        'Idle (min)': idle / 60,
+        'Spilled': ", ".join(spilled),
+    } for session_id, user, total, usage, idle, spilled in report[:limit]]
+    st.dataframe(pd.DataFrame(rows).style.format({'MB': '{:,.1f}', 'Idle (min)': '{:,.0f}'}) if rows else pd.DataFrame(rows))
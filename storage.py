@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+# Arrow IPC and Parquet need pyarrow; without it saves fall back to CSV
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Saved computation states are directories holding one table per sheet plus a manifest
+SHEETS_SUFFIX = '.sheets'
+MANIFEST_NAME = 'manifest.json'
+
+EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet', 'csv': '.csv'}
+
+# Format for new saves: uncompressed Arrow IPC when pyarrow is available. It keeps dtypes like
+# Parquet but can be memory-mapped, so opening a large saved result reads nothing up front
+# and sessions viewing the same file share the OS page cache. Parquet saves still load.
+def default_format():
+    return 'arrow' if HAS_ARROW else 'csv'
+
+def extension(fmt):
+    return EXTENSIONS[fmt]
+
+# Storage format of an existing table file, from its extension
+def format_for_path(path):
+    for fmt, ext in EXTENSIONS.items():
+        if path.endswith(ext):
+            return fmt
+    raise ValueError(f"Unknown table format: {path}")
+
+# Arrow needs one type per column. Object columns holding only ints and floats become numbers;
+# columns really mixing text with other values become text.
+def prepare_for_arrow(df):
+    converted = {}
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        inferred = pd.api.types.infer_dtype(df[column], skipna=True)
+        if inferred == 'mixed-integer-float':
+            converted[column] = pd.to_numeric(df[column])
+        elif inferred.startswith('mixed'):
+            converted[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    if not converted:
+        return df
+    # The caller's frame is left as it was; only the converted columns are new
+    df = df.copy(deep=False)
+    for column, values in converted.items():
+        df[column] = values
+    return df
+
+# Write a frame as a single table file; the format follows the file extension. The file is
+# written beside the target and swapped in, so readers that memory-mapped the old file keep
+# a valid mapping.
+def write_table(df, path, index=True):
+    fmt = format_for_path(path)
+    staging = path + '.tmp'
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(prepare_for_arrow(df), preserve_index=None if index else False)
+        feather.write_feather(table, staging, compression='uncompressed')
+    elif fmt == 'parquet':
+        prepare_for_arrow(df).to_parquet(staging, compression=PARQUET_COMPRESSION, index=None if index else False)
+    else:
+        df.to_csv(staging, index=index)
+    os.replace(staging, path)
+
+# Memory-map an Arrow IPC file read-only and return it as a pyarrow Table. Pages are only
+# read when rows are converted, e.g. one page at a time by table_view.render_table.
+def open_table(path, columns=None):
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if columns is None:
+        return table
+    # Keep stored index columns so the projected frame still has its index
+    metadata = table.schema.pandas_metadata or {}
+    index_columns = [column for column in metadata.get('index_columns', []) if isinstance(column, str)]
+    return table.select(list(columns) + [column for column in index_columns if column not in columns])
+
+# Read a table file, optionally only some of its columns. Arrow IPC and Parquet restore dtypes
+# and the index; CSV is re-parsed, with the first column as index when index_col=0.
+def read_table(path, columns=None, index_col=None):
+    fmt = format_for_path(path)
+    if fmt == 'arrow':
+        # Numeric columns without missing values stay zero-copy views of the mapped file
+        return open_table(path, columns).to_pandas(split_blocks=True)
+    if fmt == 'parquet':
+        return pd.read_parquet(path, columns=columns)
+    df = pd.read_csv(path, index_col=index_col)
+    return df if columns is None else df[list(columns)]
+
+# File-system-safe name for a sheet; the manifest keeps the original
+def sheet_file_stem(position, name):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_').lower()
+    return f"{position:02d}_{slug or 'sheet'}"
+
+# Save every sheet as its own table in `directory`, replacing a previous save of the same name
+def save_sheets(sheets, directory, fmt=None):
+    fmt = fmt or default_format()
+    staging = directory + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    entries = []
+    for position, (name, df) in enumerate(sheets.items()):
+        file_name = sheet_file_stem(position, name) + extension(fmt)
+        file_path = os.path.join(staging, file_name)
+        write_table(df, file_path)
+        # Sizes let the UI describe a saved state without loading any sheet
+        entries.append({
+            'name': name,
+            'file': file_name,
+            'rows': len(df),
+            'columns': len(df.columns),
+            'bytes': os.path.getsize(file_path),
+        })
+    with open(os.path.join(staging, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump({'format': fmt, 'sheets': entries}, manifest_file, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(staging, directory)
+
+# Manifest of a saved state: its format and, per sheet, name, file, rows, columns and bytes
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME)) as manifest_file:
+        return json.load(manifest_file)
+
+# Load one sheet by name, optionally projecting columns. With mapped=True an Arrow sheet comes
+# back as a memory-mapped pyarrow Table instead of a DataFrame.
+def load_sheet(directory, name, columns=None, manifest=None, mapped=False):
+    manifest = manifest or read_manifest(directory)
+    for entry in manifest['sheets']:
+        if entry['name'] == name:
+            path = os.path.join(directory, entry['file'])
+            if mapped and format_for_path(path) == 'arrow':
+                return open_table(path, columns)
+            return read_table(path, columns=columns, index_col=0)
+    raise KeyError(name)
+
+# Load the named sheets (all by default) into a dict keyed by sheet name, in saved order
+def load_sheets(directory, names=None):
+    manifest = read_manifest(directory)
+    wanted = [entry['name'] for entry in manifest['sheets'] if names is None or entry['name'] in names]
+    return {name: load_sheet(directory, name, manifest=manifest) for name in wanted}
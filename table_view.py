@@ -0,0 +1,59 @@
+import math
+
+import pandas as pd
+import streamlit as st
+
+import instrumentation
+
+# Rows styled and sent to the browser per page
+DEFAULT_PAGE_SIZE = 100
+
+# Number formats shared by the keyword sheets in app1
+SHEET_FORMATS = {
+    'Volume': '{:,.0f}', 'Difficulty': '{:.2f}', 'Traffic potential': '{:,.0f}', 'Global volume': '{:,.0f}', 'CPC': '{:.2f}', 'CPS': '{:.2f}', 'Opportunity Score': '{:.2f}'
+}
+
+# Column (min, max) of every numeric column, the bounds background_gradient would compute
+def gradient_bounds(df):
+    numeric = df.select_dtypes(include='number')
+    return {column: (numeric[column].min(), numeric[column].max()) for column in numeric.columns}
+
+# Style a single page: number formats, a viridis gradient scaled to the whole sheet's bounds,
+# and white cells for missing values
+def style_page(page, formats, bounds, highlight_missing=True):
+    styler = page.style.format({column: fmt for column, fmt in formats.items() if column in page.columns})
+    for column, (vmin, vmax) in bounds.items():
+        if column in page.columns and pd.notna(vmin):
+            styler = styler.background_gradient(cmap='viridis', subset=[column], vmin=vmin, vmax=vmax)
+    if highlight_missing:
+        styler = styler.applymap(lambda x: 'background-color: white; color: black;' if pd.isna(x) or x == '' else '')
+    return styler
+
+# Render a sheet one page at a time: only the visible rows are styled and shipped to the browser.
+# The frame arrives already sorted on the server; pass precomputed bounds to skip the min/max pass.
+# `df` may also be a memory-mapped pyarrow Table (see storage.open_table) when bounds are given.
+def render_table(df, key, formats=None, bounds=None, page_size=DEFAULT_PAGE_SIZE, highlight_missing=True):
+    formats = SHEET_FORMATS if formats is None else formats
+    bounds = gradient_bounds(df) if bounds is None else bounds
+
+    page_count = max(1, math.ceil(len(df) / page_size))
+    page_key = f"{key}_page"
+    # A new, shorter sheet must not leave the page selector out of range
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    # Styling and sending the page is the costly part; it shows up per table in the timings
+    with instrumentation.stage(f"render {key}", rows_in=len(df)) as record:
+        if isinstance(df, pd.DataFrame):
+            page_df = df.iloc[start:start + page_size]
+        else:
+            # A memory-mapped Arrow table: only the visible rows are read and converted
+            page_df = df.slice(start, page_size).to_pandas()
+        st.dataframe(style_page(page_df, formats, bounds, highlight_missing))
+        record.rows_out = len(page_df)
+    if page_count > 1:
+        st.caption(f"Rows {start + 1:,}-{start + len(page_df):,} of {len(df):,}")